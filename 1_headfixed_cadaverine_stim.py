@@ -2,6 +2,7 @@
 # author: paula.pflitsch@lin-magdeburg.de
 
 
+import numpy as np
 from stytra import Stytra, Protocol
 from lightparam import Param
 from stytra.stimulation.stimuli.arduino import WriteArduinoPin
@@ -53,39 +54,58 @@ class OdorProtocol(Protocol):
         self.odor2_off = Param(1.0, limits=None)  # second odor ON
         self.repeats = Param(1, limits=None)
 
-    def get_stim_sequence(self):
-        stimuli = []
-
-        for _ in range(int(self.repeats)):
-            # WATER ON (pin 11 = HIGH) for water_on_1 seconds
-            stimuli.append(WriteArduinoPin(pin_values_dict={11: 1}, duration=float(self.water_on_1)))
-
-            # WATER OFF (pin 11 = LOW)
-            stimuli.append(WriteArduinoPin(pin_values_dict={11: 0}, duration=float(self.water_off_1)))
-
-            # CADAVERINE ON (pin 3 = HIGH)
-            stimuli.append(WriteArduinoPin(pin_values_dict={3: 1}, duration=float(self.cadav_on)))
-
-            # CADAVERINE OFF (pin 3 = LOW)
-            stimuli.append(WriteArduinoPin(pin_values_dict={3: 0}, duration=float(self.cadav_off)))
-
-            # WATER ON again
-            stimuli.append(WriteArduinoPin(pin_values_dict={11: 1}, duration=float(self.water_on_2)))
-
-            # WATER OFF (pin 11 = LOW)
-            stimuli.append(WriteArduinoPin(pin_values_dict={11: 0}, duration=float(self.water_off_2)))
-
-            # Test 3rd valve for odor2
-            # ODOR 2 ON (pin 7 = HIGH)
-            stimuli.append(WriteArduinoPin(pin_values_dict={7: 1}, duration=float(self.odor2_on)))
-
-            # ODOR 2 OFF (pin 7 = LOW)
-            stimuli.append(WriteArduinoPin(pin_values_dict={7: 0}, duration=float(self.odor2_off)))
+    # One repeat as (pin, value, duration param) steps. A duration of None is
+    # a fixed 0.5 s hold.
+    _BLOCK = (
+        (11, 1, "water_on_1"),  # WATER ON (pin 11 = HIGH)
+        (11, 0, "water_off_1"),  # WATER OFF (pin 11 = LOW)
+        (3, 1, "cadav_on"),  # CADAVERINE ON (pin 3 = HIGH)
+        (3, 0, "cadav_off"),  # CADAVERINE OFF (pin 3 = LOW)
+        (11, 1, "water_on_2"),  # WATER ON again
+        (11, 0, "water_off_2"),  # WATER OFF (pin 11 = LOW)
+        (7, 1, "odor2_on"),  # ODOR 2 ON (pin 7 = HIGH)
+        (7, 0, "odor2_off"),  # ODOR 2 OFF (pin 7 = LOW)
+        (11, 0, None),  # ensure water is OFF at the end of the block
+    )
 
-            # Optional: ensure water is OFF at the end of the block
-            stimuli.append(WriteArduinoPin(pin_values_dict={11: 0}, duration=0.5))
+    def _block_transitions(self):
+        """
+        Collapse one repeat into (pin, value, duration) transitions.
+
+        Only pins whose level actually changes are written, so every
+        WriteArduinoPin is one board update. Steps that change nothing
+        (e.g. the final water OFF) are folded into the previous hold.
+        """
+        state = {}
+        transitions = []
+        for pin, value, duration_name in self._BLOCK:
+            duration = 0.5 if duration_name is None else float(getattr(self, duration_name))
+            if state.get(pin) == value and transitions:
+                transitions[-1][2] += duration
+                continue
+            state[pin] = value
+            transitions.append([pin, value, duration])
+        return transitions
+
+    def timeline(self):
+        """
+        Whole protocol as parallel arrays (t_start, pin, value, duration),
+        built by tiling one repeat instead of looping over repeats.
+        """
+        block = np.array(self._block_transitions(), dtype=float).reshape(-1, 3)
+        table = np.tile(block, (int(self.repeats), 1))
+        pins = table[:, 0].astype(np.uint8)
+        values = table[:, 1].astype(np.uint8)
+        durations = table[:, 2]
+        t_start = np.concatenate(([0.0], np.cumsum(durations)[:-1]))
+        return t_start, pins, values, durations
 
-        return stimuli
+    def get_stim_sequence(self):
+        _, pins, values, durations = self.timeline()
+        return [
+            WriteArduinoPin(pin_values_dict={pin: value}, duration=duration)
+            for pin, value, duration in zip(pins.tolist(), values.tolist(), durations.tolist())
+        ]
 
 
 if __name__ == "__main__":
@@ -1,15 +1,53 @@
 # test if basler camera is visible to opencv
 
+import functools
+
 import cv2
 from pypylon import pylon
 
+SERIAL = None  # e.g. "40123456" to open a specific camera; None = first one found
+
+
+@functools.lru_cache(maxsize=1)
+def _devices():
+    # enumeration walks every transport layer (slow); do it once per process
+    return tuple(pylon.TlFactory.GetInstance().EnumerateDevices())
+
+
+def _open_device():
+    tl = pylon.TlFactory.GetInstance()
+    if SERIAL is not None:
+        info = pylon.DeviceInfo()
+        info.SetSerialNumber(SERIAL)
+        return tl.CreateDevice(info)  # direct open, no enumeration
+    return tl.CreateDevice(_devices()[0])
+
+
 # see if Basler camera is listed
-tl=pylon.TlFactory.GetInstance()
-devices = tl.EnumerateDevices()
+devices = _devices()
 print("Devices:",devices)
 
-# capture an image
-cap=cv2.VideoCapture(0) # try different numbers: 0,1,2,..
+# capture an image straight from pylon: keep only the newest frame so the
+# preview is ~1 frame old instead of draining a queue of stale buffers
+if SERIAL is not None or devices:
+    cam = pylon.InstantCamera(_open_device())
+    cam.Open()
+    cam.MaxNumBuffer.Value = 1
+    cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
+    grab = cam.RetrieveResult(5000, pylon.TimeoutHandling_ThrowException)
+    print("Got pylon frame:", grab.GrabSucceeded(), grab.Array.shape if grab.GrabSucceeded() else None)
+    grab.Release()
+    cam.StopGrabbing()
+    cam.Close()
+
+# capture an image: prefer the pylon GStreamer source (conversion done by GStreamer
+# plugins, appsink keeps only the newest buffer); fall back to a plain device index
+GST_PIPELINE = ("pylonsrc ! videoconvert ! video/x-raw,format=BGR ! "
+                "appsink max-buffers=1 drop=true sync=false")
+cap = cv2.VideoCapture(GST_PIPELINE, cv2.CAP_GSTREAMER)
+if not cap.isOpened():
+    cap=cv2.VideoCapture(0) # try different numbers: 0,1,2,..
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # don't let the backend queue stale frames
 ret, frame = cap.read()
 print("Got frame:", ret, frame.shape if ret else None)
 cv2.imshow("Test", frame)
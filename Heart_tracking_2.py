@@ -16,15 +16,26 @@ Notes
   (but then you'll need a trigger for every frame).
 """
 
+import abc
 import argparse
+import collections
+import concurrent.futures
+import ctypes
+import functools
+import json
 import os
+import queue
 import re
+import selectors
+import subprocess
 import sys
 import time
 import threading
-from dataclasses import dataclass
-from typing import Optional, Tuple
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
 
+import cv2
+import numpy as np
 import PySpin
 
 
@@ -39,32 +50,59 @@ def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def next_2p_name(dest_dir: str, base_prefix: str, ext: str = ".avi") -> Tuple[str, str]:
+@functools.lru_cache(maxsize=64)
+def _split_series(base_prefix: str) -> Tuple[str, int]:
+    """
+    Splits a prefix already ending in A## into (base, ##); otherwise (prefix, 1).
+    """
+    m = _SUFFIX_RE.match(base_prefix)
+    if m:
+        return m.group("base"), int(m.group("num"))
+    return base_prefix, 1
+
+
+def _scan_series(dest_dir: str, base: str, ext: str) -> int:
+    """
+    Returns the highest existing A## number for base + ext in dest_dir (0 if none).
+    """
+    # Match: base + "A" + two digits + ext (fixed layout, so plain string checks suffice)
+    head = base + "A"
+    i = len(head)
+    name_len = i + 2 + len(ext)
+    max_num = 0
+    with os.scandir(dest_dir) as entries:
+        for entry in entries:
+            fn = entry.name
+            if len(fn) != name_len or not (fn.startswith(head) and fn.endswith(ext)):
+                continue
+            num = fn[i:i + 2]
+            if num.isdecimal():
+                max_num = max(max_num, int(num))
+    return max_num
+
+
+def next_2p_name(dest_dir: str, base_prefix: str, ext: str = ".avi",
+                 cache: Optional[Dict[Tuple[str, str, str], int]] = None) -> Tuple[str, str]:
     """
     Returns (stem, full_path) where stem ends with A## (zero-padded).
     Example: base_prefix="exp1_" -> "exp1_A01"
     If base_prefix already ends with A##, it increments that series.
     Otherwise it appends A01.
+
+    If `cache` is given, the directory is only scanned on the first call for a series;
+    later calls in the same session continue from the last number handed out.
     """
     _ensure_dir(dest_dir)
 
     # If user provided base already ending in A##
-    m = _SUFFIX_RE.match(base_prefix)
-    if m:
-        base = m.group("base")
-        start_num = int(m.group("num"))
-    else:
-        base = base_prefix
-        start_num = 1
+    base, start_num = _split_series(base_prefix)
 
-    # Scan existing files to find max A##
-    # Match: base + "A" + two digits + ext
-    pattern = re.compile(re.escape(base) + r"A(?P<num>\d{2})" + re.escape(ext) + r"$")
-    max_num = 0
-    for fn in os.listdir(dest_dir):
-        mm = pattern.match(fn)
-        if mm:
-            max_num = max(max_num, int(mm.group("num")))
+    # Scan existing files to find max A## (once per session when cached)
+    key = (dest_dir, base, ext)
+    if cache is not None and key in cache:
+        max_num = cache[key]
+    else:
+        max_num = _scan_series(dest_dir, base, ext)
 
     # If user gave A## explicitly and it's higher than scanned, respect it
     max_num = max(max_num, start_num - 1)
@@ -72,6 +110,14 @@ def next_2p_name(dest_dir: str, base_prefix: str, ext: str = ".avi") -> Tuple[st
     new_num = max_num + 1
     stem = f"{base}A{new_num:02d}"
     full_path = os.path.join(dest_dir, stem + ext)
+
+    # Someone else wrote into the series since we scanned: fall back to a fresh scan
+    if cache is not None and os.path.exists(full_path):
+        del cache[key]
+        return next_2p_name(dest_dir, base_prefix, ext, cache)
+
+    if cache is not None:
+        cache[key] = new_num
     return stem, full_path
 
 
@@ -79,7 +125,7 @@ def next_2p_name(dest_dir: str, base_prefix: str, ext: str = ".avi") -> Tuple[st
 # PySpin configuration
 # -------------------------
 
-@dataclass
+@dataclass(frozen=True)
 class CaptureConfig:
     dest_dir: str
     base_prefix: str
@@ -97,33 +143,114 @@ class CaptureConfig:
     stop_on_falling: bool = True  # stop recording when TTL goes low
     max_triggered_s: Optional[float] = None  # safety cap; None = no cap (not recommended)
     use_acquisition_stop: bool = True  # try to use AcquisitionStop trigger if supported
+    # "auto" (nvenc if an NVIDIA encoder works, else spinvideo), "spinvideo" (CPU MJPG),
+    # "mjpg" (multi-core MJPG), "nvenc"/"qsv"/"amf" (ffmpeg H.264 on the GPU), "h264" (best of
+    # nvenc/qsv/amf/libx264) or "raw"
+    encoder: str = "auto"
+    bitrate: str = "20M"  # target bitrate for the ffmpeg H.264 encoders
+    stream_buffers: Optional[int] = None  # driver-side frame buffers; None = max(30, 2 s of frames)
+    packet_delay: Optional[int] = None  # GigE only: GevSCPD inter-packet delay (ticks)
 
 
-def _set_enum(nodemap, node_name: str, entry_name: str) -> None:
-    node = PySpin.CEnumerationPtr(nodemap.GetNode(node_name))
-    if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
-        raise RuntimeError(f"Node {node_name} not writable/available.")
+@dataclass
+class RuntimeState:
+    """
+    What the session learns while running (camera capabilities, naming cache);
+    CaptureConfig itself stays immutable.
+    """
+    acq_stop_configured: bool = False  # AcquisitionStop trigger set up on the falling edge
+    stop_event: Optional[str] = None  # device event signalling the end of a triggered recording
+    tick_hz: Optional[float] = None  # chunk timestamp frequency; None = chunk data unavailable
+    pixel_format: str = "Mono8"  # format the camera actually streams (PixelFormat may not be settable)
+    nodemap: Optional["NodeMapCache"] = None  # device nodemap with memoized lookups, set after cam.Init()
+    trigger_selector: str = "AcquisitionStart"  # selector prepare_trigger routes and arms (--trigger-selector)
+    live_trigger_toggle: bool = True  # False once TriggerMode proved read-only while streaming
+
+    # last A## handed out per (dest_dir, base, ext), so next_2p_name scans the directory once
+    series_cache: Dict[Tuple[str, str, str], int] = field(default_factory=dict, repr=False)
+
+
+class NodeMapCache:
+    """
+    Wraps a GenICam nodemap and memoizes node lookups/casts and enum entry values, so
+    reconfiguring (every 't' arms and disarms the triggers) skips the by-name XML lookups.
+    Availability/writability is still checked on every write: it depends on camera state.
+    Accepted anywhere the _set_* helpers take a nodemap.
+    """
+    def __init__(self, nodemap):
+        self._nodemap = nodemap
+        self._raw = {}
+        self._nodes = {}
+        self._entries: Dict[Tuple[str, str], int] = {}
+
+    def GetNode(self, node_name: str):
+        node = self._raw.get(node_name)
+        if node is None:
+            node = self._raw[node_name] = self._nodemap.GetNode(node_name)
+        return node
+
+    def node(self, node_name: str, ptr_type):
+        key = (node_name, ptr_type)
+        node = self._nodes.get(key)
+        if node is None:
+            node = self._nodes[key] = ptr_type(self.GetNode(node_name))
+        return node
+
+    def entry_value(self, node, node_name: str, entry_name: str) -> int:
+        key = (node_name, entry_name)
+        value = self._entries.get(key)
+        if value is None:
+            value = self._entries[key] = _lookup_entry_value(node, node_name, entry_name)
+        return value
+
+
+def _get_node(nodemap, node_name: str, ptr_type):
+    if isinstance(nodemap, NodeMapCache):
+        return nodemap.node(node_name, ptr_type)
+    return ptr_type(nodemap.GetNode(node_name))
+
+
+def _lookup_entry_value(node, node_name: str, entry_name: str) -> int:
     entry = node.GetEntryByName(entry_name)
     if not PySpin.IsAvailable(entry) or not PySpin.IsReadable(entry):
         raise RuntimeError(f"Enum entry {entry_name} for {node_name} not readable/available.")
-    node.SetIntValue(entry.GetValue())
+    return entry.GetValue()
+
+
+def _set_enum(nodemap, node_name: str, entry_name: str) -> None:
+    node = _get_node(nodemap, node_name, PySpin.CEnumerationPtr)
+    if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
+        raise RuntimeError(f"Node {node_name} not writable/available.")
+    if isinstance(nodemap, NodeMapCache):
+        value = nodemap.entry_value(node, node_name, entry_name)
+    else:
+        value = _lookup_entry_value(node, node_name, entry_name)
+    node.SetIntValue(value)
 
 
 def _set_float(nodemap, node_name: str, value: float) -> None:
-    node = PySpin.CFloatPtr(nodemap.GetNode(node_name))
+    node = _get_node(nodemap, node_name, PySpin.CFloatPtr)
     if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
         raise RuntimeError(f"Node {node_name} not writable/available.")
     node.SetValue(value)
 
 
 def _set_bool(nodemap, node_name: str, value: bool) -> None:
-    node = PySpin.CBooleanPtr(nodemap.GetNode(node_name))
+    node = _get_node(nodemap, node_name, PySpin.CBooleanPtr)
+    if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
+        raise RuntimeError(f"Node {node_name} not writable/available.")
+    node.SetValue(value)
+
+
+def _set_int(nodemap, node_name: str, value: int) -> None:
+    node = _get_node(nodemap, node_name, PySpin.CIntegerPtr)
     if not PySpin.IsAvailable(node) or not PySpin.IsWritable(node):
         raise RuntimeError(f"Node {node_name} not writable/available.")
     node.SetValue(value)
 
+
 def _is_enum_entry_available(nodemap, node_name: str, entry_name: str) -> bool:
-    node = PySpin.CEnumerationPtr(nodemap.GetNode(node_name))
+    node = _get_node(nodemap, node_name, PySpin.CEnumerationPtr)
     if not PySpin.IsAvailable(node) or not PySpin.IsReadable(node):
         return False
     entry = node.GetEntryByName(entry_name)
@@ -138,23 +265,80 @@ def _try_set_enum(nodemap, node_name: str, entry_name: str) -> bool:
         return False
 
 
-def read_line_status(nodemap, line_name: str) -> Optional[bool]:
+@dataclass
+class CameraNodes:
+    """
+    GenICam node pointers resolved once after cam.Init(), so hot paths skip
+    the by-name nodemap lookups.
+    """
+    line_selector: Optional[PySpin.CEnumerationPtr] = None
+    line_entry: Optional[int] = None  # LineSelector value of the trigger line
+    line_status: Optional[PySpin.CBooleanPtr] = None
+
+
+def resolve_camera_nodes(nodemap, line_name: str) -> CameraNodes:
+    nodes = CameraNodes()
+    selector = PySpin.CEnumerationPtr(nodemap.GetNode("LineSelector"))
+    if PySpin.IsAvailable(selector) and PySpin.IsReadable(selector):
+        entry = selector.GetEntryByName(line_name)
+        if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+            nodes.line_selector = selector
+            nodes.line_entry = entry.GetValue()
+    status = PySpin.CBooleanPtr(nodemap.GetNode("LineStatus"))
+    if PySpin.IsAvailable(status):
+        nodes.line_status = status
+    return nodes
+
+
+def read_line_status(nodes: CameraNodes) -> Optional[bool]:
     """
     Returns True/False for the current electrical level of the selected line,
     or None if the camera doesn't expose LineStatus.
     """
+    if nodes.line_selector is None or nodes.line_status is None:
+        return None
     try:
-        _set_enum(nodemap, "LineSelector", line_name)
-        node = PySpin.CBooleanPtr(nodemap.GetNode("LineStatus"))
-        if not PySpin.IsAvailable(node) or not PySpin.IsReadable(node):
+        if not PySpin.IsWritable(nodes.line_selector) or not PySpin.IsReadable(nodes.line_status):
             return None
-        return bool(node.GetValue())
+        nodes.line_selector.SetIntValue(nodes.line_entry)
+        return bool(nodes.line_status.GetValue())
     except Exception:
         return None
 
 
-def configure_camera_for_freerun(cam: PySpin.CameraPtr, cfg: CaptureConfig) -> None:
-    nodemap = cam.GetNodeMap()
+class LineEventHandler(PySpin.DeviceEventHandler):
+    """
+    Device-event callback for the end of a triggered recording.
+    Sets `fired` once the camera reports the configured event (falling edge / acquisition end).
+    """
+    def __init__(self, event_name: str):
+        super().__init__()
+        self.event_name = event_name
+        self.fired = threading.Event()
+
+    def OnDeviceEvent(self, event_name):
+        if event_name == self.event_name:
+            self.fired.set()
+
+
+def _enable_stop_event(nodemap, cfg: CaptureConfig, state: RuntimeState) -> Optional[str]:
+    """
+    Turns on event notification for the end of a triggered recording.
+    Returns the enabled event name, or None if the camera has no suitable event.
+    """
+    candidates = [f"{cfg.trigger_line}FallingEdge"]
+    if state.acq_stop_configured:
+        candidates.append("AcquisitionEnd")
+    for event_name in candidates:
+        if not _is_enum_entry_available(nodemap, "EventSelector", event_name):
+            continue
+        if _try_set_enum(nodemap, "EventSelector", event_name) and _try_set_enum(nodemap, "EventNotification", "On"):
+            return event_name
+    return None
+
+
+def configure_camera_for_freerun(cam: PySpin.CameraPtr, cfg: CaptureConfig, state: RuntimeState) -> None:
+    nodemap = state.nodemap
 
     # Acquisition mode: Continuous
     _set_enum(nodemap, "AcquisitionMode", "Continuous")
@@ -169,6 +353,9 @@ def configure_camera_for_freerun(cam: PySpin.CameraPtr, cfg: CaptureConfig) -> N
         # Some cameras require using Stream/Device nodemaps or different naming
         # Keep going if PixelFormat can't be set; you'll get whatever default is.
         pass
+    pixel_format = PySpin.CEnumerationPtr(nodemap.GetNode("PixelFormat"))
+    if PySpin.IsAvailable(pixel_format) and PySpin.IsReadable(pixel_format):
+        state.pixel_format = pixel_format.GetCurrentEntry().GetSymbolic()
 
     # Optional: fixed exposure/gain
     if cfg.exposure_us is not None:
@@ -185,11 +372,64 @@ def configure_camera_for_freerun(cam: PySpin.CameraPtr, cfg: CaptureConfig) -> N
         except Exception:
             pass
 
+    # Per-frame hardware timestamps (used for recording duration / safety cap)
+    state.tick_hz = _enable_chunk_timestamp(nodemap)
 
-def configure_camera_for_triggered(cam: PySpin.CameraPtr, cfg: CaptureConfig) -> None:
-    nodemap = cam.GetNodeMap()
 
-    _set_enum(nodemap, "AcquisitionMode", "Continuous")
+def _enable_chunk_timestamp(nodemap) -> Optional[float]:
+    """
+    Turns on the Timestamp chunk so every image carries the camera's clock.
+    Returns the timestamp tick frequency in Hz, or None if chunk data isn't supported
+    (frames then fall back to the transport-layer timestamp, also in ns).
+    """
+    try:
+        _set_bool(nodemap, "ChunkModeActive", True)
+        _set_enum(nodemap, "ChunkSelector", "Timestamp")
+        _set_bool(nodemap, "ChunkEnable", True)
+    except Exception:
+        return None
+    # GigE cameras may report their own tick rate; SFNC cameras count ns
+    freq = PySpin.CIntegerPtr(nodemap.GetNode("GevTimestampTickFrequency"))
+    if PySpin.IsAvailable(freq) and PySpin.IsReadable(freq):
+        return float(freq.GetValue())
+    return 1e9
+
+
+def configure_stream(cam: PySpin.CameraPtr, cfg: CaptureConfig) -> None:
+    """
+    Allocates a fixed pool of stream buffers so short host stalls don't turn into
+    incomplete/lost frames. Must be called before BeginAcquisition.
+    """
+    s_nodemap = cam.GetTLStreamNodeMap()
+
+    # Deliver every frame in order; a backlog is drained rather than skipped
+    if not _try_set_enum(s_nodemap, "StreamBufferHandlingMode", "OldestFirst"):
+        print("[WARN] Could not set StreamBufferHandlingMode=OldestFirst.")
+
+    count = cfg.stream_buffers
+    if count is None:
+        count = max(30, int(cfg.fps * 2))
+    try:
+        _set_enum(s_nodemap, "StreamBufferCountMode", "Manual")
+        _set_int(s_nodemap, "StreamBufferCountManual", int(count))
+        print(f"[INFO] Stream buffers: {count}")
+    except Exception as e:
+        print(f"[WARN] Could not set stream buffer count ({e}); using driver default.")
+
+    # GigE: spread packets out if the NIC/switch drops bursts
+    if cfg.packet_delay is not None:
+        try:
+            _set_int(cam.GetNodeMap(), "GevSCPD", int(cfg.packet_delay))
+        except Exception:
+            print("[WARN] GevSCPD not available (not a GigE camera?); packet delay ignored.")
+
+
+def prepare_trigger(cam: PySpin.CameraPtr, cfg: CaptureConfig, state: RuntimeState) -> None:
+    """
+    Writes the trigger routing (line, source, activation) once, leaving TriggerMode Off.
+    Call after configure_camera_for_freerun; arming/disarming is then only set_trigger_mode().
+    """
+    nodemap = state.nodemap
 
     # Configure line as input if possible
     try:
@@ -199,56 +439,67 @@ def configure_camera_for_triggered(cam: PySpin.CameraPtr, cfg: CaptureConfig) ->
         pass
 
     # IMPORTANT: TriggerMode applies to the currently selected TriggerSelector on many cameras.
-    # So we configure AcquisitionStart first...
+    # So we configure the start selector (AcquisitionStart or FrameStart) first...
+    _set_enum(nodemap, "TriggerSelector", state.trigger_selector)
     _try_set_enum(nodemap, "TriggerMode", "Off")
-
-    _set_enum(nodemap, "TriggerSelector", "AcquisitionStart")
     _set_enum(nodemap, "TriggerSource", cfg.trigger_line)
     _set_enum(nodemap, "TriggerActivation", "RisingEdge")
-    _set_enum(nodemap, "TriggerMode", "On")
 
     # Optionally configure AcquisitionStop on falling edge (if the camera supports it)
-    cfg._acq_stop_configured = False  # attach runtime flag on cfg
+    state.acq_stop_configured = False
     if cfg.use_acquisition_stop and _is_enum_entry_available(nodemap, "TriggerSelector", "AcquisitionStop"):
         try:
             _set_enum(nodemap, "TriggerSelector", "AcquisitionStop")
+            _try_set_enum(nodemap, "TriggerMode", "Off")
             _set_enum(nodemap, "TriggerSource", cfg.trigger_line)
             _set_enum(nodemap, "TriggerActivation", "FallingEdge")
-            _set_enum(nodemap, "TriggerMode", "On")
-            cfg._acq_stop_configured = True
+            state.acq_stop_configured = True
             print("[INFO] AcquisitionStop trigger configured (FallingEdge).")
         except Exception:
-            cfg._acq_stop_configured = False
+            state.acq_stop_configured = False
             print("[WARN] Camera supports AcquisitionStop but configuration failed; will use LineStatus polling.")
     else:
         if cfg.use_acquisition_stop:
             print("[INFO] AcquisitionStop trigger not available; will use LineStatus polling to stop on falling edge.")
 
-    # Pixel format
-    try:
-        _set_enum(nodemap, "PixelFormat", cfg.pixel_format)
-    except Exception:
-        pass
+    # Prefer an async device event for the falling edge over per-frame LineStatus reads
+    state.stop_event = _enable_stop_event(nodemap, cfg, state)
+    if state.stop_event is not None:
+        print(f"[INFO] Stop event notification enabled ({state.stop_event}).")
 
-    # Optional: fixed exposure/gain
-    if cfg.exposure_us is not None:
-        try:
-            _set_enum(nodemap, "ExposureAuto", "Off")
-            _set_float(nodemap, "ExposureTime", float(cfg.exposure_us))
-        except Exception:
-            pass
 
-    if cfg.gain_db is not None:
-        try:
-            _set_enum(nodemap, "GainAuto", "Off")
-            _set_float(nodemap, "Gain", float(cfg.gain_db))
-        except Exception:
-            pass
+def set_trigger_mode(cam: PySpin.CameraPtr, state: RuntimeState, on: bool) -> None:
+    """
+    Arms (on=True) or disarms the triggers set up by prepare_trigger; only TriggerMode is written.
+    """
+    nodemap = state.nodemap
+    trigger_selectors = [state.trigger_selector]
+    if state.acq_stop_configured:
+        trigger_selectors.append("AcquisitionStop")
+    for selector in trigger_selectors:
+        _set_enum(nodemap, "TriggerSelector", selector)
+        _set_enum(nodemap, "TriggerMode", "On" if on else "Off")
+
 
 # -------------------------
 # Recording
 # -------------------------
 
+class VideoSink(abc.ABC):
+    """
+    Recorder interface used by record_video: Append(frame) takes a (H, W[, C]) numpy
+    frame, Close() finalizes the file. The frame is a slot of FrameHandler's ring and is
+    reused once Append returns; sinks that keep it longer must copy it.
+    """
+    @abc.abstractmethod
+    def Append(self, frame: np.ndarray) -> None:
+        ...
+
+    @abc.abstractmethod
+    def Close(self) -> None:
+        ...
+
+
 def _create_avi_recorder(output_path: str, fps: float) -> PySpin.SpinVideo:
     """
     Creates an MJPG AVI recorder via PySpin SpinVideo.
@@ -262,133 +513,562 @@ def _create_avi_recorder(output_path: str, fps: float) -> PySpin.SpinVideo:
     return recorder
 
 
-def record_video(cam: PySpin.CameraPtr, cfg: CaptureConfig, wait_for_trigger_first_frame: bool) -> str:
+class SpinVideoSink(VideoSink):
+    """
+    PySpin SpinVideo MJPG writer fed with numpy frames (re-wrapped as PySpin images).
+    """
+    def __init__(self, output_path: str, fps: float, pixel_format: str):
+        self._video = _create_avi_recorder(output_path, fps)
+        self._pixel_format = getattr(PySpin, f"PixelFormat_{pixel_format}")
+
+    def Append(self, frame: np.ndarray) -> None:
+        height, width = frame.shape[:2]
+        self._video.Append(PySpin.Image.Create(width, height, 0, 0, self._pixel_format, frame))
+
+    def Close(self) -> None:
+        self._video.Close()
+
+
+# PySpin pixel format name -> ffmpeg rawvideo pix_fmt
+_FFMPEG_PIX_FMTS = {
+    "Mono8": "gray",
+    "Mono16": "gray16le",
+    "RGB8": "rgb24",
+    "BGR8": "bgr24",
+}
+
+
+# H.264 encoders in order of preference, with low-latency constant-bitrate settings
+_FFMPEG_H264_CODECS = {
+    "h264_nvenc": ["-preset", "p4", "-tune", "ll", "-rc", "cbr"],
+    "h264_qsv": ["-preset", "veryfast"],
+    "h264_amf": ["-usage", "lowlatency", "-rc", "cbr"],
+    "libx264": ["-preset", "ultrafast", "-tune", "zerolatency"],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_codec_works(codec: str) -> bool:
+    """Encodes a few blank frames with `codec` to check the GPU/driver is really there."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+        "-c:v", codec, "-f", "null", "-",
+    ]
+    try:
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def pick_h264_codec() -> str:
+    """
+    First working encoder of NVENC -> QSV -> AMF -> libx264.
+    """
+    for codec in _FFMPEG_H264_CODECS:
+        if _ffmpeg_codec_works(codec):
+            return codec
+    raise RuntimeError("No usable ffmpeg H.264 encoder found (is ffmpeg on PATH?).")
+
+
+class FFmpegRecorder(VideoSink):
+    """
+    VideoSink that pipes raw frames into an ffmpeg child process (h264_nvenc by
+    default), so compression runs on the GPU / in another process instead of on the
+    capture thread.
+
+    Frames are written straight from the numpy buffer (no extra copy).
+    ffmpeg is started on the first frame, once width/height are known.
+    """
+    def __init__(self, output_path: str, fps: float, pixel_format: str, codec: str = "h264_nvenc",
+                 bitrate: str = "20M"):
+        self.output_path = output_path
+        self.fps = float(fps)
+        self.codec = codec
+        self.bitrate = bitrate
+        self.pix_fmt = _FFMPEG_PIX_FMTS.get(pixel_format)
+        if self.pix_fmt is None:
+            raise RuntimeError(f"Pixel format {pixel_format} not supported by the ffmpeg recorder.")
+        self._proc: Optional[subprocess.Popen] = None
+
+    def _start(self, frame: np.ndarray) -> None:
+        height, width = frame.shape[:2]
+        hw_upload = []
+        if self.codec == "h264_nvenc":
+            # hand NVENC an NV12 surface already on the GPU instead of letting it
+            # convert/copy the frame on the CPU side (for Mono8 the conversion only adds flat chroma)
+            hw_upload = ["-init_hw_device", "cuda=cu", "-filter_hw_device", "cu",
+                         "-vf", "format=nv12,hwupload_cuda"]
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", self.pix_fmt,
+            "-s", f"{width}x{height}", "-r", str(self.fps),
+            "-i", "-",
+            *hw_upload,
+            "-c:v", self.codec, *_FFMPEG_H264_CODECS.get(self.codec, []), "-b:v", self.bitrate,
+            self.output_path,
+        ]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+
+    def Append(self, frame: np.ndarray) -> None:
+        if self._proc is None:
+            self._start(frame)
+        self._proc.stdin.write(frame)
+
+    def Close(self) -> None:
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc = None
+
+
+class ParallelMJPGRecorder(VideoSink):
+    """
+    VideoSink that JPEG-encodes frames on a thread pool (cv2.imencode releases the
+    GIL) instead of serially inside SpinVideo.Append.
+
+    Encoded frames are written in capture order (futures are kept in a FIFO acting as
+    the reorder buffer) into an ffmpeg child that only muxes them into an MJPG AVI
+    (-c:v copy). At most 2 x workers frames are in flight; beyond that Append waits on
+    the oldest one, which backs up FrameHandler's queue so frames get dropped there
+    rather than stalling acquisition.
+    """
+    def __init__(self, output_path: str, fps: float, quality: int = 75, workers: Optional[int] = None):
+        self.output_path = output_path
+        self.fps = float(fps)
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self._pending: collections.deque = collections.deque()
+        self._proc: Optional[subprocess.Popen] = None
+
+    def _start(self) -> None:
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "image2pipe", "-c:v", "mjpeg", "-r", str(self.fps),
+            "-i", "-",
+            "-c:v", "copy",
+            self.output_path,
+        ]
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        ok, buf = cv2.imencode(".jpg", frame, self.params)
+        if not ok:
+            raise RuntimeError("JPEG encoding failed.")
+        return buf.tobytes()
+
+    def _write_oldest(self) -> None:
+        self._proc.stdin.write(self._pending.popleft().result())
+
+    def Append(self, frame: np.ndarray) -> None:
+        if self._proc is None:
+            self._start()
+        # the ring slot is reused after we return: workers get their own copy
+        self._pending.append(self._pool.submit(self._encode, frame.copy()))
+        while self._pending and (self._pending[0].done() or len(self._pending) > 2 * self.workers):
+            self._write_oldest()
+
+    def Close(self) -> None:
+        if self._proc is None:
+            return
+        while self._pending:
+            self._write_oldest()
+        self._pool.shutdown()
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc = None
+
+
+class RawRecorder(VideoSink):
+    """
+    VideoSink that stores frames uncompressed in a memory-mapped (frames, H, W[, C])
+    file: one memcpy per frame, no encoding on the capture machine. A <stem>.json sidecar records shape/dtype/fps/count so the file
+    can be wrapped or transcoded offline.
+
+    `capacity` is the expected frame count; the file grows (doubling) if it is exceeded.
+    """
+    def __init__(self, output_path: str, fps: float, capacity: int):
+        self.output_path = output_path
+        self.fps = float(fps)
+        self.capacity = max(1, int(capacity))
+        self.count = 0
+        self._mm: Optional[np.memmap] = None
+
+    def _open(self, frame: np.ndarray, mode: str) -> None:
+        self._mm = np.memmap(self.output_path, dtype=frame.dtype, mode=mode,
+                             shape=(self.capacity,) + frame.shape)
+
+    def Append(self, frame: np.ndarray) -> None:
+        if self._mm is None:
+            self._open(frame, "w+")
+        elif self.count == self.capacity:
+            # out of room: grow the file and remap
+            self._mm.flush()
+            self._mm = None
+            self.capacity *= 2
+            with open(self.output_path, "r+b") as f:
+                f.truncate(self.capacity * frame.nbytes)
+            self._open(frame, "r+")
+        np.copyto(self._mm[self.count], frame)
+        self.count += 1
+
+    def Close(self) -> None:
+        if self._mm is None:
+            return
+        frame_shape = self._mm.shape[1:]
+        dtype = self._mm.dtype
+        self._mm.flush()
+        self._mm = None
+        # drop the unused tail of the preallocated file
+        with open(self.output_path, "r+b") as f:
+            f.truncate(self.count * int(np.prod(frame_shape)) * dtype.itemsize)
+        meta = dict(shape=[self.count, *frame_shape], dtype=dtype.str, fps=self.fps, frames=self.count)
+        with open(os.path.splitext(self.output_path)[0] + ".json", "w") as f:
+            json.dump(meta, f, indent=2)
+
+
+# --encoder name -> ffmpeg codec (None = pick the first working one)
+_FFMPEG_ENCODERS = {
+    "nvenc": "h264_nvenc",
+    "qsv": "h264_qsv",
+    "amf": "h264_amf",
+    "h264": None,
+}
+
+
+def resolve_encoder(encoder: str) -> str:
+    """
+    Maps "auto" to "nvenc" when ffmpeg can encode on an NVIDIA GPU, otherwise "spinvideo".
+    """
+    if encoder != "auto":
+        return encoder
+    return "nvenc" if _ffmpeg_codec_works("h264_nvenc") else "spinvideo"
+
+
+def _create_recorder(output_path: str, cfg: CaptureConfig, state: RuntimeState, expected_frames: int) -> VideoSink:
+    encoder = resolve_encoder(cfg.encoder)
+    if encoder in _FFMPEG_ENCODERS:
+        codec = _FFMPEG_ENCODERS[encoder] or pick_h264_codec()
+        return FFmpegRecorder(output_path, cfg.fps, state.pixel_format, codec=codec, bitrate=cfg.bitrate)
+    if encoder == "raw":
+        return RawRecorder(output_path, cfg.fps, capacity=expected_frames)
+    if encoder == "mjpg":
+        return ParallelMJPGRecorder(output_path, cfg.fps)
+    return SpinVideoSink(output_path, cfg.fps, state.pixel_format)
+
+
+def copy_into(data: np.ndarray, dst: np.ndarray) -> None:
+    """
+    Copies a frame into a preallocated ring slot with one flat memmove (no numpy
+    broadcasting/stride machinery); falls back to np.copyto for padded or strided frames.
+    """
+    if data.flags.c_contiguous and data.nbytes == dst.nbytes:
+        ctypes.memmove(dst.ctypes.data, data.ctypes.data, dst.nbytes)
+    else:
+        np.copyto(dst, data)
+
+
+class FrameHandler(PySpin.ImageEventHandler):
+    """
+    Spinnaker image-event callback feeding a preallocated ring of frame slots.
+
+    OnImageEvent runs on the driver's acquisition thread. While armed, the pixels of each
+    complete frame are copied into a free slot of `ring` (so the driver can requeue its
+    buffer right away, and no per-frame allocation happens) and the slot index is pushed
+    to `frames`; the consumer hands the slot back with release(). When no slot is free the
+    frame is counted as dropped instead of stalling acquisition. While disarmed (idle
+    free-run) frames are ignored.
+
+    Timing uses the camera's per-frame timestamps (chunk data when enabled), not the
+    host clock: `first_ts`/`last_ts` and the per-frame `timestamps` are in camera ticks.
+    """
+    def __init__(self, ring_size: int = 32):
+        super().__init__()
+        self.size = ring_size
+        self.ring: Optional[np.ndarray] = None  # (size, H, W[, C]), allocated on the first frame
+        self.frames = queue.Queue()  # filled slot indices, in capture order
+        self._free = queue.Queue()
+        self.first_frame = threading.Event()
+        self.done = threading.Event()
+        self.accepted = 0
+        self.dropped = 0
+        self.incomplete = 0
+        self.first_ts: Optional[int] = None
+        self.last_ts: Optional[int] = None
+        self.timestamps = []
+        self.capped = False
+        self.chunk_timestamps = False
+        self._limit: Optional[int] = None
+        self._max_ticks: Optional[float] = None
+        self._armed = False
+
+    def arm(self, limit: Optional[int] = None, max_ticks: Optional[float] = None) -> None:
+        """
+        Start queueing frames; stop (and set `done`) after `limit` frames, or at the first
+        frame whose timestamp is `max_ticks` or more past the first one (sets `capped`; that
+        frame is not kept), if given.
+        """
+        # A callback still running at disarm() can queue a slot after the writer drained
+        # `frames`: free it, so it neither starts this recording nor leaks
+        while True:
+            try:
+                slot = self.frames.get_nowait()
+            except queue.Empty:
+                break
+            self._free.put_nowait(slot)
+        self.first_frame.clear()
+        self.done.clear()
+        self.accepted = 0
+        self.dropped = 0
+        self.incomplete = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.timestamps = []
+        self.capped = False
+        self._limit = limit
+        self._max_ticks = max_ticks
+        self._armed = True
+
+    def disarm(self) -> None:
+        self._armed = False
+
+    def release(self, slot: int) -> None:
+        """Returns a ring slot once its frame has been written."""
+        self._free.put_nowait(slot)
+
+    def _alloc_ring(self, frame: np.ndarray) -> None:
+        # only on the first frame (or if the image format changed between recordings)
+        self.ring = np.empty((self.size,) + frame.shape, dtype=frame.dtype)
+        self._free = queue.Queue()
+        for slot in range(self.size):
+            self._free.put_nowait(slot)
+
+    def OnImageEvent(self, image):
+        if not self._armed:
+            return
+        if image.IsIncomplete():
+            # buffer under-run / lost packets: never queue partial frames
+            self.incomplete += 1
+            return
+        ts = image.GetChunkData().GetTimestamp() if self.chunk_timestamps else image.GetTimeStamp()
+        if self._max_ticks is not None and self.first_ts is not None and (ts - self.first_ts) >= self._max_ticks:
+            self.capped = True
+            self._armed = False
+            self.done.set()
+            return
+        data = image.GetNDArray()
+        if self.ring is None or self.ring.shape[1:] != data.shape or self.ring.dtype != data.dtype:
+            self._alloc_ring(data)
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        copy_into(data, self.ring[slot])
+        self.frames.put_nowait(slot)
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        self.timestamps.append(ts)
+        self.accepted += 1
+        self.first_frame.set()
+        if self._limit is not None and self.accepted >= self._limit:
+            self._armed = False
+            self.done.set()
+
+
+class FrameWriter(threading.Thread):
+    """
+    Spooler thread: appends filled ring slots to the recorder (and frees them) until
+    stop() is called and the queue has been drained.
+    """
+    def __init__(self, handler: FrameHandler, recorder: VideoSink):
+        super().__init__(daemon=True)
+        self.handler = handler
+        self.recorder = recorder
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        # bind once: this loop runs for every frame
+        handler = self.handler
+        get = handler.frames.get
+        release = handler.release
+        append = self.recorder.Append
+        empty = queue.Empty
+        stop = self._stop_event
+        while True:
+            try:
+                slot = get(timeout=0.1)
+            except empty:
+                if stop.is_set():
+                    return
+                continue
+            append(handler.ring[slot])
+            release(slot)
+
+    def stop(self) -> None:
+        """Waits for the queue to drain, then ends the thread."""
+        self._stop_event.set()
+        self.join()
+
+
+def record_video(cam: PySpin.CameraPtr, cfg: CaptureConfig, state: RuntimeState, handler: FrameHandler,
+                 nodes: CameraNodes, wait_for_trigger_first_frame: bool,
+                 arm_trigger: Optional[Callable[[Callable[[], None]], None]] = None) -> str:
     """
     Records a video to disk and returns the output file path.
 
+    Frames are delivered by `handler` (registered on the camera) and encoded on a
+    separate writer thread, so encoding never blocks acquisition.
+
     If wait_for_trigger_first_frame=True, blocks until first image arrives (rising edge / start trigger).
 
+    arm_trigger, if given, is called once the recorder and writer are ready, with the function
+    that arms `handler`; it switches the camera to triggered mode and must call that function
+    after the last free-run frame and before the trigger can fire, so no triggered frame is lost.
+
     Stop behavior:
-      - In free-run: records duration_s seconds worth of frames (as before)
+      - In free-run: records duration_s seconds by the camera clock (capped at duration_s*fps frames)
       - In triggered: starts on rising edge, then stops when TTL line goes LOW (falling edge),
         using LineStatus polling. If AcquisitionStop trigger is configured, the camera may also
         stop streaming on falling edge; we handle that too.
     """
-    stem, out_path = next_2p_name(cfg.dest_dir, cfg.base_prefix, ext=".avi")
+    ext = ".raw" if cfg.encoder == "raw" else ".avi"
+    stem, out_path = next_2p_name(cfg.dest_dir, cfg.base_prefix, ext=ext, cache=state.series_cache)
     print(f"[INFO] Recording will be saved as: {out_path}")
 
-    recorder = _create_avi_recorder(out_path, cfg.fps)
-
-    nodemap = cam.GetNodeMap()
-
     # Free-run target frames
     target_frames = max(1, int(round(cfg.duration_s * cfg.fps)))
 
-    t0 = time.time()
-    frames_written = 0
-    started = False
-
-    if wait_for_trigger_first_frame:
-        print("[INFO] Waiting for rising-edge trigger (first frame)...")
-        while True:
-            try:
-                img = cam.GetNextImage(cfg.timeout_ms)
-                if img.IsIncomplete():
-                    img.Release()
-                    continue
-                recorder.Append(img)
-                img.Release()
-                frames_written = 1
-                started = True
-                print("[INFO] Trigger received, recording started.")
-                break
-            except PySpin.SpinnakerException:
-                continue
-
     # Decide mode: triggered stop-on-falling vs free-run fixed duration
     triggered_stop = wait_for_trigger_first_frame and cfg.stop_on_falling
 
-    if not triggered_stop:
-        # --------------------
-        # FREE-RUN: fixed size
-        # --------------------
-        print(f"[INFO] Target: {target_frames} frames at ~{cfg.fps} fps (~{cfg.duration_s:.2f} s)")
-        while frames_written < target_frames:
-            try:
-                img = cam.GetNextImage(cfg.timeout_ms)
-                if img.IsIncomplete():
-                    img.Release()
-                    continue
-                recorder.Append(img)
-                img.Release()
-                frames_written += 1
-            except PySpin.SpinnakerException as e:
-                print(f"[WARN] Image grab issue/timeout: {e}")
-                continue
+    expected_frames = target_frames
+    if triggered_stop and cfg.max_triggered_s is not None:
+        expected_frames = max(1, int(round(cfg.max_triggered_s * cfg.fps)))
+    recorder = _create_recorder(out_path, cfg, state, expected_frames)
 
-    else:
-        # ----------------------------------------
-        # TRIGGERED: stop when TTL falls (line low)
-        # ----------------------------------------
-        print("[INFO] Triggered stop condition: falling edge / line goes LOW.")
-
-        # optional safety cap
-        max_s = cfg.max_triggered_s
-        if max_s is not None:
-            print(f"[INFO] Safety cap enabled: max_triggered_s={max_s:.2f}s")
-
-        # read initial status if possible (may already be high)
-        line_status = read_line_status(nodemap, cfg.trigger_line)
-        if line_status is None:
-            print("[WARN] LineStatus not readable on this camera; falling-edge stop will rely on timeouts/safety cap.")
-        else:
-            print(f"[INFO] LineStatus after start: {'HIGH' if line_status else 'LOW'}")
+    # Falling-edge stop via device event when available (registered before the trigger can fire)
+    line_event = None
+    if triggered_stop and state.stop_event is not None:
+        line_event = LineEventHandler(state.stop_event)
+        try:
+            cam.RegisterEventHandler(line_event, state.stop_event)
+        except PySpin.SpinnakerException as e:
+            print(f"[WARN] Could not register {state.stop_event} event ({e}); falling back to LineStatus polling.")
+            line_event = None
+
+    writer = FrameWriter(handler, recorder)
+    writer.start()
+    # Duration (free-run) and safety cap (triggered) are checked against the camera clock
+    # in the image callback; in free-run target_frames only acts as a backstop
+    handler.chunk_timestamps = state.tick_hz is not None
+    tick_hz = state.tick_hz or 1e9
+    max_s = cfg.max_triggered_s if triggered_stop else cfg.duration_s
+    arm = functools.partial(handler.arm, limit=None if triggered_stop else target_frames,
+                            max_ticks=None if max_s is None else max_s * tick_hz)
 
-        consecutive_timeouts = 0
+    try:
+        if arm_trigger is not None:
+            arm_trigger(arm)
+        else:
+            arm()
+
+        if wait_for_trigger_first_frame:
+            print("[INFO] Waiting for rising-edge trigger (first frame)...")
+            while not handler.first_frame.wait(0.5):
+                pass
+            print("[INFO] Trigger received, recording started.")
+
+        if not triggered_stop:
+            # --------------------
+            # FREE-RUN: fixed duration (camera clock), at most target_frames
+            # --------------------
+            print(f"[INFO] Target: {cfg.duration_s:.2f} s by camera clock (<= {target_frames} frames at ~{cfg.fps} fps)")
+            while not handler.done.wait(0.5):
+                pass
 
-        while True:
-            # Stop if TTL is low (best-effort)
-            if line_status is False:
-                print("[INFO] LineStatus is LOW -> stopping recording.")
-                break
+        else:
+            # ----------------------------------------
+            # TRIGGERED: stop when TTL falls (line low)
+            # ----------------------------------------
+            print("[INFO] Triggered stop condition: falling edge / line goes LOW.")
+
+            # optional safety cap
+            if max_s is not None:
+                print(f"[INFO] Safety cap enabled: max_triggered_s={max_s:.2f}s")
+
+            if line_event is not None:
+                line_status = None
+            else:
+                # read initial status if possible (may already be high)
+                line_status = read_line_status(nodes)
+                if line_status is None:
+                    print("[WARN] LineStatus not readable on this camera; falling-edge stop will rely on timeouts/safety cap.")
+                else:
+                    print(f"[INFO] LineStatus after start: {'HIGH' if line_status else 'LOW'}")
+
+            # If AcquisitionStop is configured, a falling edge stops the stream: no frames for a while.
+            stall_s = 3 * cfg.timeout_ms / 1000.0
+            poll_s = 1.0 / cfg.fps
+            # stall detection only needs the host clock once per poll, not per frame; it counts
+            # every arrival (also dropped/incomplete ones): a slow writer is not a stopped stream
+            seen_frames = handler.accepted + handler.dropped + handler.incomplete
+            seen_t = time.monotonic()
+
+            while True:
+                # Stop if TTL is low (best-effort)
+                if line_status is False:
+                    print("[INFO] LineStatus is LOW -> stopping recording.")
+                    break
 
-            # Safety cap
-            if max_s is not None and (time.time() - t0) >= max_s:
-                print("[INFO] Safety cap reached -> stopping recording.")
-                break
+                if line_event is not None and line_event.fired.is_set():
+                    print(f"[INFO] {line_event.event_name} event -> stopping recording.")
+                    break
 
-            try:
-                img = cam.GetNextImage(cfg.timeout_ms)
-                consecutive_timeouts = 0
-                if img.IsIncomplete():
-                    img.Release()
-                    # refresh line status and continue
-                    line_status = read_line_status(nodemap, cfg.trigger_line)
-                    continue
-                recorder.Append(img)
-                img.Release()
-                frames_written += 1
-
-                # refresh trigger line level
-                line_status = read_line_status(nodemap, cfg.trigger_line)
-
-            except PySpin.SpinnakerException as e:
-                # If AcquisitionStop is configured, a falling edge may stop acquisition and cause timeouts.
-                consecutive_timeouts += 1
-                print(f"[WARN] Image grab timeout/issue: {e}")
-
-                # If we already started and now get repeated timeouts, assume acquisition stopped (common after AcqStop)
-                if started and consecutive_timeouts >= 3:
-                    print("[INFO] Repeated timeouts after start -> assuming acquisition stopped (possible falling-edge stop).")
+                # Safety cap (camera timestamps)
+                if handler.capped:
+                    print("[INFO] Safety cap reached -> stopping recording.")
                     break
 
-                # refresh line status (maybe line went low)
-                line_status = read_line_status(nodemap, cfg.trigger_line)
-                continue
+                now = time.monotonic()
+                arrived = handler.accepted + handler.dropped + handler.incomplete
+                if arrived != seen_frames:
+                    seen_frames, seen_t = arrived, now
+                elif (now - seen_t) >= stall_s:
+                    print("[INFO] No frames after start -> assuming acquisition stopped (possible falling-edge stop).")
+                    break
 
-    recorder.Close()
-    dt = time.time() - t0
+                if line_event is not None:
+                    line_event.fired.wait(poll_s)
+                else:
+                    time.sleep(poll_s)
+                    line_status = read_line_status(nodes)
+    finally:
+        handler.disarm()
+        if line_event is not None:
+            cam.UnregisterEventHandler(line_event)
+        writer.stop()
+        recorder.Close()
+
+    frames_written = handler.accepted
+    if handler.dropped:
+        print(f"[WARN] Dropped {handler.dropped} frames (no free ring slot; writer too slow).")
+    if handler.incomplete:
+        print(f"[WARN] Discarded {handler.incomplete} incomplete frames (consider more --buffer-count).")
+    dt = 0.0 if handler.first_ts is None else (handler.last_ts - handler.first_ts) / tick_hz
     print(f"[INFO] Saved {frames_written} frames in {dt:.2f}s -> {out_path}")
+
+    # Per-frame camera timestamps (ns) for aligning the video with other recordings
+    if handler.timestamps:
+        ts_path = os.path.join(cfg.dest_dir, f"{stem}_timestamps.npy")
+        ts_ns = np.asarray(handler.timestamps, dtype=np.int64)
+        if tick_hz != 1e9:
+            ts_ns = (ts_ns * (1e9 / tick_hz)).astype(np.int64)
+        np.save(ts_path, ts_ns)
+        print(f"[INFO] Frame timestamps -> {ts_path}")
     print(f"[INFO] Output stem (2p-style): {stem}")
     return out_path
 
@@ -399,7 +1079,10 @@ def record_video(cam: PySpin.CameraPtr, cfg: CaptureConfig, wait_for_trigger_fir
 
 class CommandListener:
     """
-    Reads stdin commands in a background thread.
+    Reads stdin commands.
+    On POSIX, wait() blocks in the kernel (selectors) until input arrives: no thread, no polling.
+    Windows can't select() on stdin, so there lines are read by a background thread and
+    handed over through a queue that wait() blocks on (no polling either).
     Commands:
       - 't' + Enter: arm trigger & record once
       - 'r' + Enter: record immediately in free-run
@@ -407,20 +1090,45 @@ class CommandListener:
       - 'h' + Enter: help
     """
     def __init__(self):
-        self.last_cmd = None
         self._stop = False
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._pending = collections.deque()
+        self._lines: queue.Queue = queue.Queue()  # Windows reader thread -> wait(); None = EOF
+        self._sel: Optional[selectors.BaseSelector] = None
+        self._thread: Optional[threading.Thread] = None
+        if os.name == "posix":
+            self._sel = selectors.DefaultSelector()
+            self._sel.register(sys.stdin.fileno(), selectors.EVENT_READ)
+        else:
+            self._thread = threading.Thread(target=self._run, daemon=True)
 
     def start(self):
-        self._thread.start()
+        if self._thread is not None:
+            self._thread.start()
 
     def stop(self):
         self._stop = True
+        if self._sel is not None:
+            self._sel.close()
+
+    def wait(self) -> Optional[str]:
+        """
+        Blocks until the next command and returns it, or None once stdin is closed.
+        """
+        if self._sel is not None:
+            while not self._pending:
+                self._sel.select()
+                data = os.read(sys.stdin.fileno(), 1024)
+                if not data:
+                    # EOF
+                    self._stop = True
+                    return None
+                # several lines may arrive in one read; hand them out one by one
+                self._pending.extend(data.decode(errors="replace").splitlines())
+            return self._pending.popleft().strip().lower()
 
-    def pop(self) -> Optional[str]:
-        cmd = self.last_cmd
-        self.last_cmd = None
-        return cmd
+        if self._stop and self._lines.empty():
+            return None
+        return self._lines.get()
 
     def _run(self):
         while not self._stop:
@@ -428,12 +1136,54 @@ class CommandListener:
                 line = sys.stdin.readline()
                 if not line:
                     # EOF
-                    self._stop = True
-                    return
-                self.last_cmd = line.strip().lower()
+                    break
+                self._lines.put(line.strip().lower())
             except Exception:
-                self._stop = True
-                return
+                break
+        self._stop = True
+        self._lines.put(None)
+
+
+def _switch_trigger(cam: PySpin.CameraPtr, state: RuntimeState, on: bool,
+                    before_start: Optional[Callable[[], None]] = None) -> None:
+    """
+    Switches TriggerMode. An AcquisitionStart trigger can only arm a new acquisition (the running
+    one keeps delivering free-run frames), so that selector always gets the End/Begin restart.
+    FrameStart is flipped while the camera keeps streaming; cameras that lock TriggerMode during
+    acquisition get the restart instead (remembered, so later switches go straight there).
+    before_start runs once TriggerMode is set and before frames can arrive in the new mode.
+    """
+    if state.trigger_selector == "FrameStart" and state.live_trigger_toggle:
+        try:
+            set_trigger_mode(cam, state, on)
+        except (RuntimeError, PySpin.SpinnakerException):
+            state.live_trigger_toggle = False
+            print("[INFO] TriggerMode is locked while streaming; restarting acquisition to switch modes.")
+        else:
+            if before_start is not None:
+                before_start()
+            return
+    cam.EndAcquisition()
+    set_trigger_mode(cam, state, on)
+    if before_start is not None:
+        before_start()
+    cam.BeginAcquisition()
+
+
+def _record_triggered(cam: PySpin.CameraPtr, cfg: CaptureConfig, state: RuntimeState,
+                      handler: FrameHandler, nodes: CameraNodes) -> None:
+    """
+    Arms the trigger, records once, then returns to free-run. Only TriggerMode is flipped
+    (see _switch_trigger for when the acquisition has to be restarted). The recorder is set up
+    first and the handler armed before the trigger can fire, so the first frames are kept.
+    """
+    # Record (wait for trigger before first frame)
+    record_video(cam, cfg, state, handler, nodes, wait_for_trigger_first_frame=True,
+                 arm_trigger=lambda arm: _switch_trigger(cam, state, True, before_start=arm))
+
+    # Return to free-run default
+    _switch_trigger(cam, state, False)
+    print("[INFO] Returned to free-run mode.")
 
 
 def run(cfg: CaptureConfig) -> None:
@@ -448,9 +1198,20 @@ def run(cfg: CaptureConfig) -> None:
     cam = cam_list.GetByIndex(0)
     cam.Init()
 
+    # Frames are delivered by callback; size the ring for >= 20 frames of encode slack
+    handler = FrameHandler(ring_size=max(20, int(cfg.fps)))
+    cam.RegisterEventHandler(handler)
+
+    nodes = resolve_camera_nodes(cam.GetNodeMap(), cfg.trigger_line)
+    state = RuntimeState(nodemap=NodeMapCache(cam.GetNodeMap()),
+                         trigger_selector=cfg.trigger_selector)
+
     try:
-        # Default: free-run configuration
-        configure_camera_for_freerun(cam, cfg)
+        # Default: free-run configuration; trigger routing is written once up front
+        configure_camera_for_freerun(cam, cfg, state)
+        prepare_trigger(cam, cfg, state)
+        configure_stream(cam, cfg)
+        print(f"[INFO] Video encoder: {resolve_encoder(cfg.encoder)}")
 
         # Start acquisition so the camera is "live" in free-run
         cam.BeginAcquisition()
@@ -458,16 +1219,7 @@ def run(cfg: CaptureConfig) -> None:
         # If user started the program in --mode trigger, arm immediately and record once
         if cfg.triggered:
             print("[INFO] Starting in trigger mode: arming immediately.")
-            cam.EndAcquisition()
-            configure_camera_for_triggered(cam, cfg)
-            cam.BeginAcquisition()
-            record_video(cam, cfg, wait_for_trigger_first_frame=True)
-
-            # Return to free-run afterwards
-            cam.EndAcquisition()
-            configure_camera_for_freerun(cam, cfg)
-            cam.BeginAcquisition()
-            print("[INFO] Returned to free-run mode.")
+            _record_triggered(cam, cfg, state, handler, nodes)
 
         listener = CommandListener()
         listener.start()
@@ -480,11 +1232,10 @@ def run(cfg: CaptureConfig) -> None:
         print("  h  -> help\n")
 
         while True:
-            cmd = listener.pop()
+            cmd = listener.wait()
             if cmd is None:
-                # Light-weight "heartbeat" so loop doesn't spin too hard
-                time.sleep(0.05)
-                continue
+                print("[INFO] stdin closed -> quitting.")
+                break
 
             if cmd == "h":
                 print("Commands: t=triggered record, r=free-run record, q=quit, h=help")
@@ -496,29 +1247,13 @@ def run(cfg: CaptureConfig) -> None:
 
             if cmd == "r":
                 print("[INFO] Free-run record requested.")
-                # Ensure free-run config
-                cam.EndAcquisition()
-                configure_camera_for_freerun(cam, cfg)
-                cam.BeginAcquisition()
-                record_video(cam, cfg, wait_for_trigger_first_frame=False)
+                # Camera is already streaming in free-run: no reconfiguration needed
+                record_video(cam, cfg, state, handler, nodes, wait_for_trigger_first_frame=False)
                 continue
 
             if cmd == "t":
                 print("[INFO] Triggered record requested (arming trigger).")
-                # Switch to triggered mode, arm trigger, record once, then return to free-run
-                cam.EndAcquisition()
-                configure_camera_for_triggered(cam, cfg)
-                cam.BeginAcquisition()
-
-
-                # Record (wait for trigger before first frame)
-                record_video(cam, cfg, wait_for_trigger_first_frame=True)
-
-                # Return to free-run default
-                cam.EndAcquisition()
-                configure_camera_for_freerun(cam, cfg)
-                cam.BeginAcquisition()
-                print("[INFO] Returned to free-run mode.")
+                _record_triggered(cam, cfg, state, handler, nodes)
                 continue
 
             print(f"[WARN] Unknown command: {cmd!r}. Type 'h' for help.")
@@ -527,6 +1262,7 @@ def run(cfg: CaptureConfig) -> None:
         cam.EndAcquisition()
 
     finally:
+        cam.UnregisterEventHandler(handler)
         cam.DeInit()
         del cam
         cam_list.Clear()
@@ -551,6 +1287,21 @@ def parse_args() -> CaptureConfig:
     p.add_argument("--exposure-us", type=float, default=None, help="Fixed exposure time in microseconds (optional).")
     p.add_argument("--gain-db", type=float, default=None, help="Fixed gain in dB (optional).")
     p.add_argument("--timeout-ms", type=int, default=2000, help="Image grab timeout in ms (default 2000).")
+    p.add_argument("--encoder", choices=["auto", "spinvideo", "mjpg", "nvenc", "qsv", "amf", "h264", "raw"],
+                   default="auto",
+                   help="Video encoder: auto = nvenc if an NVIDIA GPU encoder works, else spinvideo (default), "
+                        "spinvideo = PySpin MJPG on the CPU, "
+                        "mjpg = MJPG AVI encoded on all CPU cores (ffmpeg must be on PATH), "
+                        "nvenc = H.264 on an NVIDIA GPU via ffmpeg (ffmpeg must be on PATH), "
+                        "qsv = H.264 on Intel Quick Sync via ffmpeg, "
+                        "amf = H.264 on an AMD GPU via ffmpeg, "
+                        "h264 = first working of NVENC -> Intel QSV -> AMD AMF -> libx264 via ffmpeg, "
+                        "raw = uncompressed memory-mapped .raw + .json sidecar (lossless, no encoding).")
+    p.add_argument("--bitrate", default="20M", help="Target bitrate for the ffmpeg H.264 encoders (default 20M).")
+    p.add_argument("--buffer-count", "--stream-buffers", dest="stream_buffers", type=int, default=None,
+                   help="Number of driver stream buffers (default max(30, 2*fps)).")
+    p.add_argument("--packet-delay", type=int, default=None,
+                   help="GigE only: inter-packet delay GevSCPD in ticks (optional).")
 
     p.add_argument("--stop-on-falling", action="store_true",
                    help="In triggered recording, stop when trigger line goes LOW (falling edge).")
@@ -572,6 +1323,10 @@ def parse_args() -> CaptureConfig:
         exposure_us=a.exposure_us,
         gain_db=a.gain_db,
         timeout_ms=a.timeout_ms,
+        encoder=a.encoder,
+        bitrate=a.bitrate,
+        stream_buffers=a.stream_buffers,
+        packet_delay=a.packet_delay,
         stop_on_falling=a.stop_on_falling,
         max_triggered_s=a.max_triggered_s,
         use_acquisition_stop=(not a.no_acq_stop),
@@ -42,21 +42,296 @@ Installation:
 import PySpin
 import cv2
 import numpy as np
+import ctypes
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import re
+import subprocess
 import sys
 import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
+# Messages from the grab/writer threads go through a queue; a QueueListener thread (see
+# start_log_listener) does the actual stderr writes, so those threads never block on stdio
+log = logging.getLogger(__name__)
+
+
+def start_log_listener():
+    """Route this module's log records through a queue to stderr; returns the listener."""
+    log_queue = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stderr))
+    listener.start()
+    return listener
+
+
 def today_yyyymmdd() -> str:
     return datetime.now().strftime("%Y%m%d")
 
+
+# cv2.pollKey (OpenCV >= 4.5) pumps GUI events without waitKey's mandatory sleep
+# (up to a timer tick, ~15 ms, on Windows)
+poll_key = getattr(cv2, "pollKey", None) or (lambda: cv2.waitKey(1))
+
+# FourCCs for the OpenCV writer (--codec); MJPG is intra-only and cheapest to encode
+FOURCCS = {name: cv2.VideoWriter_fourcc(*tag)
+           for name, tag in (('MJPG', 'MJPG'), ('XVID', 'XVID'), ('MP4V', 'mp4v'), ('H264', 'H264'))}
+
+
+def pin_current_thread(core, high_priority=False):
+    """
+    Pin the calling thread to one CPU core and optionally raise its priority, so the OS
+    doesn't move or preempt it under load. Best effort: failures are reported, not raised.
+    """
+    try:
+        if sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+            thread = kernel32.GetCurrentThread()
+            kernel32.SetThreadAffinityMask(thread, 1 << core)
+            if high_priority:
+                kernel32.SetThreadPriority(thread, 2)  # THREAD_PRIORITY_HIGHEST
+        else:
+            os.sched_setaffinity(0, {core})  # 0 = calling thread on Linux
+            if high_priority:
+                # nice is per-thread on Linux, 0 = calling thread again;
+                # negative values need CAP_SYS_NICE/root
+                os.setpriority(os.PRIO_PROCESS, 0, -10)
+    except (AttributeError, OSError) as ex:
+        log.warning("Unable to pin thread to core %d: %s", core, ex)
+
+
+class FFmpegVideoWriter:
+    """
+    Drop-in for cv2.VideoWriter (write/isOpened/release) that pipes raw frames into an
+    ffmpeg subprocess encoding H.264 on the GPU (NVENC), keeping compression off the
+    Python thread.
+
+    Frames are collected in a preallocated contiguous batch and sent to ffmpeg with one
+    pipe write per `batch` frames; release() flushes the remainder.
+    """
+
+    def __init__(self, filename, fps, frame_size, is_color=True, codec="h264_nvenc",
+                 bitrate="8M", batch=8):
+        width, height = frame_size
+        self._buf = np.empty((batch, height, width, 3) if is_color else (batch, height, width),
+                             dtype=np.uint8)
+        self._n = 0
+        # Colour conversion on the GPU: frames are uploaded as CUDA surfaces and NVENC does
+        # the RGB->YUV conversion itself. On the CPU only a cheap repack remains (bgr24 ->
+        # bgr0 padding; gray -> nv12 is the luma plane plus flat chroma).
+        gpu_upload = ["-init_hw_device", "cuda=cu", "-filter_hw_device", "cu",
+                      "-vf", f"format={'bgr0' if is_color else 'nv12'},hwupload_cuda"]
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24" if is_color else "gray",
+            "-s", f"{width}x{height}",
+            "-r", str(fps),
+            "-i", "-",
+            *gpu_upload,
+            "-c:v", codec, "-preset", "p1", "-tune", "ll",
+            "-rc", "cbr", "-b:v", bitrate,
+            str(filename),
+        ]
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            print("ffmpeg not found on PATH")
+            self.proc = None
+
+    def isOpened(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def write(self, frame):
+        self._buf[self._n] = frame
+        self._n += 1
+        if self._n == len(self._buf):
+            self._flush()
+
+    def _flush(self):
+        try:
+            self.proc.stdin.write(memoryview(self._buf[:self._n]))
+        except (BrokenPipeError, OSError) as ex:
+            log.error("ffmpeg writer error: %s", ex)
+        self._n = 0
+
+    def release(self):
+        if self.proc is None:
+            return
+        if self._n:
+            self._flush()
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.wait()
+        self.proc = None
+
+class SpinVideoWriter:
+    """
+    MJPG AVI writer using the Spinnaker SDK (PySpin.SpinVideo). Frames are appended as
+    ImagePtr straight from the acquisition thread, so the recording never goes through
+    numpy/OpenCV; write() is therefore a no-op for the display loop.
+    """
+
+    def __init__(self, filename, fps, quality=75):
+        self._lock = threading.Lock()  # append (grab thread) vs. release (main thread)
+        self.video = PySpin.SpinVideo()
+        option = PySpin.MJPGOption()
+        option.frameRate = float(fps)
+        option.quality = quality
+        try:
+            # SpinVideo adds the .avi extension itself
+            self.video.Open(str(Path(filename).with_suffix('')), option)
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to open SpinVideo file: {ex}")
+            self.video = None
+
+    def isOpened(self):
+        return self.video is not None
+
+    def append(self, image_result):
+        with self._lock:
+            if self.video is not None:
+                self.video.Append(image_result)
+
+    def write(self, frame):
+        pass
+
+    def release(self):
+        with self._lock:
+            if self.video is not None:
+                self.video.Close()
+                self.video = None
+
+
+class RawRingWriter:
+    """
+    Uncompressed capture into a memory-mapped file, transcoded to H.264 after the recording.
+
+    The acquisition thread copies each Spinnaker buffer straight into the next memmap slot
+    (one memcpy, no codec work while grabbing). release() writes a JSON sidecar with the
+    geometry and frame count and starts ffmpeg in the background; the .raw file is deleted
+    once the transcode succeeds. When the preallocated size is used up further frames are
+    counted as dropped rather than overwriting the start of the recording.
+    """
+
+    # camera pixel format -> ffmpeg rawvideo pix_fmt
+    FFMPEG_PIX_FMTS = {'Mono8': 'gray', 'BayerRG8': 'bayer_rggb8', 'BGR8': 'bgr24'}
+
+    def __init__(self, filename, fps, frame_shape, pixel_format, size_gb):
+        self.filename = Path(filename)
+        self.raw_path = self.filename.with_suffix('.raw')
+        self.fps = fps
+        self.pixel_format = pixel_format
+        frame_bytes = int(np.prod(frame_shape))
+        max_frames = max(1, int(size_gb * 1e9) // frame_bytes)
+        self._lock = threading.Lock()  # append (grab thread) vs. release (main thread)
+        self.count = 0
+        self.dropped = 0
+        try:
+            self.mmap = np.memmap(self.raw_path, dtype=np.uint8, mode='w+',
+                                  shape=(max_frames,) + tuple(frame_shape))
+        except (OSError, ValueError) as ex:
+            print(f"Unable to allocate raw capture file: {ex}")
+            self.mmap = None
+
+    def isOpened(self):
+        return self.mmap is not None
+
+    def append(self, image_result):
+        with self._lock:
+            if self.mmap is None:
+                return
+            if self.count >= len(self.mmap):
+                self.dropped += 1
+                return
+            view = np.frombuffer(image_result.GetData(), dtype=np.uint8)
+            self.mmap[self.count] = view.reshape(self.mmap.shape[1:])
+            self.count += 1
+
+    def write(self, frame):
+        pass
+
+    def release(self):
+        with self._lock:
+            if self.mmap is None:
+                return
+            self.mmap.flush()
+            height, width = self.mmap.shape[1:3]
+            del self.mmap
+            self.mmap = None
+
+        if self.dropped:
+            print(f"Raw capture buffer full: {self.dropped} frames not recorded")
+
+        meta = {'height': height, 'width': width, 'fps': self.fps, 'count': self.count,
+                'pixel_format': self.pixel_format}
+        self.raw_path.with_suffix('.json').write_text(json.dumps(meta))
+
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", self.FFMPEG_PIX_FMTS.get(self.pixel_format, 'gray'),
+            "-s", f"{width}x{height}",
+            "-r", str(self.fps),
+            "-i", str(self.raw_path),
+            "-frames:v", str(self.count),
+            "-c:v", "libx264", "-preset", "medium",
+            # Mono8 stays single-plane (H.264 4:0:0); no chroma planes to encode and store
+            "-pix_fmt", "gray" if self.pixel_format == 'Mono8' else "yuv420p",
+            str(self.filename),
+        ]
+        # Not a daemon: the interpreter waits for the transcode (and raw file cleanup) on exit
+        threading.Thread(target=self._transcode, args=(cmd,)).start()
+
+    def discard(self):
+        """Drop the capture without transcoding: close and delete the memmap file."""
+        with self._lock:
+            if self.mmap is None:
+                return
+            del self.mmap
+            self.mmap = None
+        try:
+            self.raw_path.unlink()
+        except OSError:
+            pass
+
+    def _transcode(self, cmd):
+        try:
+            result = subprocess.run(cmd)
+        except FileNotFoundError:
+            print(f"ffmpeg not found; raw capture kept at {self.raw_path}")
+            return
+        if result.returncode == 0:
+            self.raw_path.unlink()
+            print(f"Transcoded {self.filename}")
+        else:
+            print(f"Transcode failed; raw capture kept at {self.raw_path}")
+
+
 class FLIRCameraController:
     """
     Controller for FLIR camera with free-run and triggered recording modes.
     """
 
+    # Pixel formats to request, in order of preference
+    PIXEL_FORMATS = ('Mono8', 'BayerRG8', 'BGR8')
+
+    # On-camera user set holding the full triggered-mode configuration (--install-userset)
+    TRIGGER_USERSET = 'UserSet1'
+
+    # Frames buffered between the grab thread and the display/encode loop
+    RING_SIZE = 16
+
+
     def __init__(self, output_dir="./recordings", base_filename="video"):
         """
         Initialize the camera controller.
@@ -69,6 +344,11 @@ class FLIRCameraController:
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
         self.base_filename = base_filename
+        # "<base>A<n>" recording stems; compiled once per controller
+        self._fname_re = re.compile(rf"{re.escape(base_filename)}A(\d+)")
+        self._fname_template = f"{base_filename}A{{:02d}}.avi"
+        self._current_path = None  # file of the recording in progress
+        self._current_path_str = None  # same, as str for the writers
         self.system = None
         self.cam = None
         self.nodemap = None
@@ -76,6 +356,7 @@ class FLIRCameraController:
 
         self.recording = False
         self.video_writer = None
+        self.pixel_format = None  # what the camera actually streams, see _configure_camera
         self.current_recording_number = self._get_next_recording_number()
 
         self.mode = "free-run"  # Default mode: "free-run" or "triggered"
@@ -83,39 +364,112 @@ class FLIRCameraController:
 
         # Video settings
         self.fps = 40
-        self.codec = cv2.VideoWriter_fourcc(*'XVID')
-
-        #trigger
+        # used by the "opencv" encoder: intra-only MJPG (libjpeg-turbo SIMD) instead of XVID
+        self.codec = FOURCCS['MJPG']
+        # "nvenc" (ffmpeg pipe), "spinvideo" (SDK MJPG writer) or "opencv" (cv2.VideoWriter)
+        self.encoder = "nvenc"
+        self.bitrate = "8M"  # NVENC constant bitrate
+        self.raw_ring_gb = 0  # > 0: record raw into a memmap of this size, transcode afterwards
+
+        #trigger: writer opened, the grab thread starts recording on the next frame
         self.waiting_for_trigger = False
 
+        # Acquisition thread -> main thread (display/encode): single-producer/single-consumer
+        # ring of preallocated frames. Only the grab thread advances _head and only the main
+        # thread advances _tail (plain ints, atomic under the GIL), so no lock is needed.
+        self._ring = None
+        self._ring_show = [False] * self.RING_SIZE  # per slot: frame is due for the preview
+        # per slot, decided when the frame was grabbed: goes to the recorder, camera timestamp
+        self._ring_record = [False] * self.RING_SIZE
+        self._ring_ts = [None] * self.RING_SIZE
+        self._head = 0
+        self._tail = 0
+        self._cam_lock = threading.Lock()  # GetNextImage vs. End/BeginAcquisition
+        self._grab_thread = None
+        # Ring -> writer thread (convert + encode); newest preview frame -> main thread (UI)
+        self._write_thread = None
+        self._writer_lock = threading.Lock()  # video_writer swap vs. write
+        self._preview_q = queue.Queue(maxsize=1)
+
+        # Writers pre-opened on hidden temp files: [(writer, temp_path, (size, is_color, encoder))]
+        self._writer_pool = []
+        self._pool_lock = threading.Lock()
+        self._pool_serial = 0
+        self._writer_temp = None  # temp file of the pooled writer currently recording
+        self._writer_pool_primed = False
+        self._frame_shape = None
+        self._bgr_buf = None  # debayer output, allocated on the first Bayer frame
+
+        # Status overlay rendered once per (mode, recording, mono) -> (pixels, mask)
+        self._overlay_cache = {}
+        self._last_display_t = 0.0
+        self.preview_fps = 15  # preview refresh; capture/recording run at the full camera rate
+
+        # GenICam nodes resolved once in initialize_camera (see _resolve_nodes)
+        self._nd = {}
+        self._nv = {}
+        self._trigger_setup = None  # (line, selector) last written to the camera
+        self.use_userset = False  # load TRIGGER_USERSET instead of writing the trigger nodes
+
+        # Per-frame chunk data: camera timestamps of the current recording, lost-frame count
+        self.chunk_data = False
+        self._timestamps = []
+        self._last_frame_id = None
+        self.lost_frames = 0
+        self._buffer_mode = None  # StreamBufferHandlingMode last set by _set_buffer_handling
+        self._incomplete_count = 0
+        self._last_log_t = 0.0
+
+        # Optional CPU cores for the grab thread and the writer (convert/encode) thread
+        self.grab_core = None
+        self.encode_core = None
+
+        # Headless: no OpenCV window; commands come from stdin via self._commands
+        self.headless = False
+        self._commands = queue.Queue()
+
+    @property
+    def _display_interval(self):
+        return 1.0 / self.preview_fps
+
+    @property
+    def _counter_path(self):
+        """Sidecar file holding the next recording number for this base filename."""
+        return self.output_dir / f".{self.base_filename}counter"
+
     def _get_next_recording_number(self):
         """
         Find the next available recording number based on existing files.
         Returns the next number in sequence (e.g., if A01 and A02 exist, returns 3).
         """
-        existing_files = list(self.output_dir.glob(f"{self.base_filename}A*.avi"))
-        if not existing_files:
-            return 1
-
-        # Extract numbers from filenames
-        numbers = []
-        for file in existing_files:
-            # Extract the number after 'A' from filename like "videoA01.avi"
-            name = file.stem
-            try:
-                # Find 'A' and extract digits after it
-                a_index = name.rfind('A')
-                if a_index != -1:
-                    num_str = name[a_index + 1:]
-                    numbers.append(int(num_str))
-            except (ValueError, IndexError):
-                continue
+        # Fast path: number saved by the last stop_recording, if its file is still free
+        try:
+            number = int(self._counter_path.read_text())
+            if number >= 1 and not self._filename_for(number).exists():
+                return number
+        except (OSError, ValueError):
+            pass
+
+        # Extract the number after 'A' from filenames like "videoA01.avi" (scandir: plain
+        # directory entries, no per-entry Path objects or fnmatch)
+        with os.scandir(self.output_dir) as entries:
+            matches = (self._fname_re.fullmatch(entry.name[:-4])
+                       for entry in entries if entry.name.endswith(".avi"))
+            return max((int(m.group(1)) for m in matches if m), default=0) + 1
+
+    def _save_recording_number(self):
+        """Persist the next recording number so the next start skips the directory scan."""
+        try:
+            self._counter_path.write_text(str(self.current_recording_number))
+        except OSError as ex:
+            print(f"Unable to save recording counter: {ex}")
 
-        return max(numbers) + 1 if numbers else 1
+    def _filename_for(self, number):
+        return self.output_dir / self._fname_template.format(number)
 
     def _get_current_filename(self):
         """Generate filename with current recording number."""
-        return self.output_dir / f"{self.base_filename}A{self.current_recording_number:02d}.avi"
+        return self._filename_for(self.current_recording_number)
 
     def initialize_camera(self):
         """Initialize the Spinnaker system and camera."""
@@ -141,6 +495,7 @@ class FLIRCameraController:
             # Retrieve GenICam nodemap
             self.nodemap = self.cam.GetNodeMap()
             self.nodemap_tldevice = self.cam.GetTLDeviceNodeMap()
+            self._resolve_nodes()
 
             # Print camera info
             self._print_camera_info()
@@ -176,36 +531,34 @@ class FLIRCameraController:
         """Configure camera settings."""
         try:
             # Set acquisition mode to continuous
-            node_acquisition_mode = PySpin.CEnumerationPtr(
-                self.nodemap.GetNode('AcquisitionMode'))
-            if not PySpin.IsAvailable(node_acquisition_mode) or \
-                    not PySpin.IsWritable(node_acquisition_mode):
+            if not self._set_cached('AcquisitionMode', 'Continuous'):
                 print("Unable to set acquisition mode. Aborting...")
                 return False
-
-            node_acquisition_mode_continuous = node_acquisition_mode.GetEntryByName('Continuous')
-            acquisition_mode_continuous = node_acquisition_mode_continuous.GetValue()
-            node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
             print("Acquisition mode set to continuous")
 
+            # More driver-side buffers so short host stalls don't lose frames
+            self._configure_stream_buffers(count=20)
+            self._set_buffer_handling()
+
+            # Timestamp/frame ID arrive with each image instead of separate node reads
+            self._enable_chunk_data()
+
             # Configure trigger mode based on current mode setting
             if self.mode == "triggered":
                 self._configure_trigger_mode(enable=True)
             else:
                 self._configure_trigger_mode(enable=False)
 
-            # Set pixel format to BGR8 for OpenCV compatibility
+            # Set pixel format: prefer the sensor's native Mono8 (1 byte/pixel, no on-camera
+            # color conversion); BayerRG8 is debayered on the host; BGR8 only as last resort
             try:
-                node_pixel_format = PySpin.CEnumerationPtr(
-                    self.nodemap.GetNode('PixelFormat'))
-                if PySpin.IsAvailable(node_pixel_format) and \
-                        PySpin.IsWritable(node_pixel_format):
-                    node_pixel_format_bgr8 = node_pixel_format.GetEntryByName('BGR8')
-                    if PySpin.IsAvailable(node_pixel_format_bgr8) and \
-                            PySpin.IsReadable(node_pixel_format_bgr8):
-                        pixel_format_bgr8 = node_pixel_format_bgr8.GetValue()
-                        node_pixel_format.SetIntValue(pixel_format_bgr8)
-                        print("Pixel format set to BGR8")
+                for name in self.PIXEL_FORMATS:
+                    if self._set_cached('PixelFormat', name):
+                        print(f"Pixel format set to {name}")
+                        break
+                node_pixel_format = self._nd.get('PixelFormat')
+                if node_pixel_format is not None and PySpin.IsReadable(node_pixel_format):
+                    self.pixel_format = node_pixel_format.GetCurrentEntry().GetSymbolic()
             except PySpin.SpinnakerException as ex:
                 print(f"Unable to set pixel format (will convert): {ex}")
 
@@ -215,11 +568,120 @@ class FLIRCameraController:
             print(f"Error configuring camera: {ex}")
             return False
 
+    def _configure_stream_buffers(self, count=20):
+        """Set a fixed number of Spinnaker stream buffers (TL stream nodemap)."""
+        try:
+            s_nodemap = self.cam.GetTLStreamNodeMap()
+            node_count_mode = PySpin.CEnumerationPtr(s_nodemap.GetNode('StreamBufferCountMode'))
+            if PySpin.IsAvailable(node_count_mode) and PySpin.IsWritable(node_count_mode):
+                entry = node_count_mode.GetEntryByName('Manual')
+                if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+                    node_count_mode.SetIntValue(entry.GetValue())
+
+            node_count = PySpin.CIntegerPtr(s_nodemap.GetNode('StreamBufferCountManual'))
+            if PySpin.IsAvailable(node_count) and PySpin.IsWritable(node_count):
+                node_count.SetValue(min(count, node_count.GetMax()))
+                print(f"Stream buffer count set to {node_count.GetValue()}")
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to set stream buffer count: {ex}")
+
+    def _set_buffer_handling(self, recording=None):
+        """
+        NewestOnly for the free-run preview (show the latest frame, never back up the SDK
+        queue); OldestFirst when triggered or recording so no frame is dropped.
+        """
+        if recording is None:
+            recording = self.recording
+        name = 'OldestFirst' if (recording or self.mode == "triggered") else 'NewestOnly'
+        try:
+            s_nodemap = self.cam.GetTLStreamNodeMap()
+            node_handling = PySpin.CEnumerationPtr(s_nodemap.GetNode('StreamBufferHandlingMode'))
+            if not PySpin.IsAvailable(node_handling) or not PySpin.IsWritable(node_handling):
+                return False
+            entry = node_handling.GetEntryByName(name)
+            if not PySpin.IsAvailable(entry) or not PySpin.IsReadable(entry):
+                return False
+            if node_handling.GetIntValue() != entry.GetValue():
+                node_handling.SetIntValue(entry.GetValue())
+                print(f"Stream buffer handling set to {name}")
+            if name != self._buffer_mode:
+                # FrameID gaps across a mode change are not losses
+                self._buffer_mode = name
+                self._last_frame_id = None
+            return True
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to set stream buffer handling: {ex}")
+            return False
+
+    def _resolve_nodes(self):
+        """
+        Look up the trigger/line (and acquisition/pixel format) nodes once; configuration and
+        switch_mode then reuse the pointers instead of walking the nodemap again. Missing
+        nodes are simply left out.
+        """
+        self._nd = {}
+        for name in ('TriggerMode', 'TriggerSelector', 'TriggerSource', 'TriggerActivation',
+                     'LineSelector', 'LineMode', 'AcquisitionMode', 'PixelFormat'):
+            node = PySpin.CEnumerationPtr(self.nodemap.GetNode(name))
+            if PySpin.IsAvailable(node):
+                self._nd[name] = node
+        self._nv = {}
+
+    def _entry_value(self, name, entry_name):
+        """Int value of an enum entry of a cached node (None if not available), memoized."""
+        key = (name, entry_name)
+        if key not in self._nv:
+            value = None
+            node = self._nd.get(name)
+            if node is not None:
+                entry = node.GetEntryByName(entry_name)
+                if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+                    value = entry.GetValue()
+            self._nv[key] = value
+        return self._nv[key]
+
+    def _set_cached(self, name, entry_name):
+        """Set a cached enum node to one of its entries. Returns False if not possible."""
+        node = self._nd.get(name)
+        value = self._entry_value(name, entry_name)
+        if node is None or value is None or not PySpin.IsWritable(node):
+            return False
+        node.SetIntValue(value)
+        return True
+
+    def _enable_chunk_data(self):
+        """Have the camera attach timestamp and frame ID to every image (ChunkData)."""
+        try:
+            node_chunk_active = PySpin.CBooleanPtr(self.nodemap.GetNode('ChunkModeActive'))
+            if not PySpin.IsAvailable(node_chunk_active) or not PySpin.IsWritable(node_chunk_active):
+                print("Chunk data not available on this camera (OK).")
+                return False
+            node_chunk_active.SetValue(True)
+
+            node_chunk_selector = PySpin.CEnumerationPtr(self.nodemap.GetNode('ChunkSelector'))
+            for name in ('Timestamp', 'FrameID'):
+                entry = node_chunk_selector.GetEntryByName(name)
+                if not PySpin.IsAvailable(entry) or not PySpin.IsReadable(entry):
+                    continue
+                node_chunk_selector.SetIntValue(entry.GetValue())
+                node_chunk_enable = PySpin.CBooleanPtr(self.nodemap.GetNode('ChunkEnable'))
+                if PySpin.IsAvailable(node_chunk_enable) and PySpin.IsWritable(node_chunk_enable):
+                    node_chunk_enable.SetValue(True)
+            self.chunk_data = True
+            print("Chunk data enabled (Timestamp, FrameID)")
+            return True
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to enable chunk data: {ex}")
+            return False
+
     def _configure_trigger_mode(self, enable=True, line="Line2", selector="AcquisitionStart"):
         """
         Configure hardware trigger mode.
         enable=True  -> triggered
         enable=False -> free-run
+
+        Selector/source/activation/line only need to be written once per (line, selector);
+        after that switching is a single TriggerMode write on the cached node.
         """
         try:
             # Ensure camera is not acquiring
@@ -229,65 +691,43 @@ class FLIRCameraController:
             except Exception:
                 pass
 
-            node_trigger_mode = PySpin.CEnumerationPtr(self.nodemap.GetNode('TriggerMode'))
-            if not PySpin.IsAvailable(node_trigger_mode) or not PySpin.IsWritable(node_trigger_mode):
+            if 'TriggerMode' not in self._nd or not PySpin.IsWritable(self._nd['TriggerMode']):
                 print("Unable to access TriggerMode")
                 return False
 
             # Always turn trigger OFF before changing other trigger settings
-            node_trigger_mode_off = node_trigger_mode.GetEntryByName('Off')
-            node_trigger_mode.SetIntValue(node_trigger_mode_off.GetValue())
+            self._set_cached('TriggerMode', 'Off')
 
             if enable:
-                # TriggerSelector (FrameStart vs AcquisitionStart)
-                node_trigger_selector = PySpin.CEnumerationPtr(self.nodemap.GetNode('TriggerSelector'))
-                if PySpin.IsAvailable(node_trigger_selector) and PySpin.IsWritable(node_trigger_selector):
-                    entry = node_trigger_selector.GetEntryByName(selector)
-                    if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
-                        node_trigger_selector.SetIntValue(entry.GetValue())
-                    else:
+                # One UserSetLoad replaces the individual node writes below
+                if self.use_userset and self._trigger_setup != (line, selector):
+                    if self._load_trigger_userset():
+                        self._trigger_setup = (line, selector)
+
+                if self._trigger_setup != (line, selector):
+                    # TriggerSelector (FrameStart vs AcquisitionStart)
+                    if 'TriggerSelector' not in self._nd:
+                        print("TriggerSelector not available on this camera (OK).")
+                    elif not self._set_cached('TriggerSelector', selector):
                         print(f"TriggerSelector entry '{selector}' not available; leaving default.")
-                else:
-                    print("TriggerSelector not available on this camera (OK).")
-
-                # TriggerSource (Line2)
-                node_trigger_source = PySpin.CEnumerationPtr(self.nodemap.GetNode('TriggerSource'))
-                if PySpin.IsAvailable(node_trigger_source) and PySpin.IsWritable(node_trigger_source):
-                    entry = node_trigger_source.GetEntryByName(line)
-                    if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
-                        node_trigger_source.SetIntValue(entry.GetValue())
-                    else:
+
+                    # TriggerSource (Line2)
+                    if not self._set_cached('TriggerSource', line):
                         print(f"TriggerSource '{line}' not available.")
                         return False
-                else:
-                    print("TriggerSource not available.")
-                    return False
-
-                # TriggerActivation (RisingEdge)
-                node_trigger_activation = PySpin.CEnumerationPtr(self.nodemap.GetNode('TriggerActivation'))
-                if PySpin.IsAvailable(node_trigger_activation) and PySpin.IsWritable(node_trigger_activation):
-                    entry = node_trigger_activation.GetEntryByName('RisingEdge')
-                    if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
-                        node_trigger_activation.SetIntValue(entry.GetValue())
-                else:
-                    print("TriggerActivation not available (OK).")
 
-                # Configure the physical line as input (if supported)
-                node_line_selector = PySpin.CEnumerationPtr(self.nodemap.GetNode('LineSelector'))
-                if PySpin.IsAvailable(node_line_selector) and PySpin.IsWritable(node_line_selector):
-                    entry = node_line_selector.GetEntryByName(line)
-                    if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
-                        node_line_selector.SetIntValue(entry.GetValue())
+                    # TriggerActivation (RisingEdge)
+                    if not self._set_cached('TriggerActivation', 'RisingEdge'):
+                        print("TriggerActivation not available (OK).")
+
+                    # Configure the physical line as input (if supported)
+                    if self._set_cached('LineSelector', line):
+                        self._set_cached('LineMode', 'Input')
 
-                        node_line_mode = PySpin.CEnumerationPtr(self.nodemap.GetNode('LineMode'))
-                        if PySpin.IsAvailable(node_line_mode) and PySpin.IsWritable(node_line_mode):
-                            entry2 = node_line_mode.GetEntryByName('Input')
-                            if PySpin.IsAvailable(entry2) and PySpin.IsReadable(entry2):
-                                node_line_mode.SetIntValue(entry2.GetValue())
+                    self._trigger_setup = (line, selector)
 
                 # Finally turn trigger ON
-                node_trigger_mode_on = node_trigger_mode.GetEntryByName('On')
-                node_trigger_mode.SetIntValue(node_trigger_mode_on.GetValue())
+                self._set_cached('TriggerMode', 'On')
 
                 print(f"Trigger ENABLED: {selector}, {line}, RisingEdge")
 
@@ -300,6 +740,61 @@ class FLIRCameraController:
             print(f"Error configuring trigger: {ex}")
             return False
 
+    def _select_userset(self):
+        node_userset_selector = PySpin.CEnumerationPtr(self.nodemap.GetNode('UserSetSelector'))
+        if not PySpin.IsAvailable(node_userset_selector) or \
+                not PySpin.IsWritable(node_userset_selector):
+            print("UserSetSelector not available on this camera.")
+            return False
+        entry = node_userset_selector.GetEntryByName(self.TRIGGER_USERSET)
+        if not PySpin.IsAvailable(entry) or not PySpin.IsReadable(entry):
+            print(f"User set '{self.TRIGGER_USERSET}' not available.")
+            return False
+        node_userset_selector.SetIntValue(entry.GetValue())
+        return True
+
+    def _load_trigger_userset(self):
+        """Load the saved triggered-mode configuration with a single command."""
+        try:
+            if not self._select_userset():
+                return False
+            node_userset_load = PySpin.CCommandPtr(self.nodemap.GetNode('UserSetLoad'))
+            if not PySpin.IsAvailable(node_userset_load) or not PySpin.IsWritable(node_userset_load):
+                print("UserSetLoad not available.")
+                return False
+            node_userset_load.Execute()
+            print(f"Loaded trigger configuration from {self.TRIGGER_USERSET}")
+            return True
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to load user set: {ex}")
+            return False
+
+    def install_trigger_userset(self, line="Line2", selector="AcquisitionStart"):
+        """
+        One-time setup: write the triggered-mode configuration node by node and save it to
+        TRIGGER_USERSET on the camera, so later runs can load it with --use-userset.
+        """
+        use_userset, self.use_userset = self.use_userset, False
+        try:
+            if not self._configure_trigger_mode(enable=True, line=line, selector=selector):
+                return False
+            if not self._select_userset():
+                return False
+            node_userset_save = PySpin.CCommandPtr(self.nodemap.GetNode('UserSetSave'))
+            if not PySpin.IsAvailable(node_userset_save) or not PySpin.IsWritable(node_userset_save):
+                print("UserSetSave not available.")
+                return False
+            node_userset_save.Execute()
+            print(f"Trigger configuration saved to {self.TRIGGER_USERSET}")
+            return True
+        except PySpin.SpinnakerException as ex:
+            print(f"Unable to save user set: {ex}")
+            return False
+        finally:
+            self.use_userset = use_userset
+            # back to the mode the controller was started in
+            self._configure_trigger_mode(enable=self.mode == "triggered", line=line, selector=selector)
+
     def switch_mode(self, new_mode):
         if new_mode not in ["free-run", "triggered"]:
             print(f"Invalid mode: {new_mode}")
@@ -310,94 +805,447 @@ class FLIRCameraController:
 
         print(f"Switching from {self.mode} to {new_mode} mode...")
 
-        if self.recording:
+        if self.recording or self.waiting_for_trigger:
             self.stop_recording()
 
-        if self.cam and self.cam.IsStreaming():
-            self.cam.EndAcquisition()
+        # Hold the acquisition thread off the camera while the stream is restarted
+        with self._cam_lock:
+            if self.cam and self.cam.IsStreaming():
+                self.cam.EndAcquisition()
 
-        self.mode = new_mode
+            self.mode = new_mode
 
-        if new_mode == "triggered":
-            ok = self._configure_trigger_mode(enable=True, line="Line2", selector="AcquisitionStart")
-        else:
-            ok = self._configure_trigger_mode(enable=False)
+            if new_mode == "triggered":
+                ok = self._configure_trigger_mode(enable=True, line="Line2", selector="AcquisitionStart")
+            else:
+                ok = self._configure_trigger_mode(enable=False)
 
-        if not ok:
-            print("Failed to switch mode.")
-            return False
+            if not ok:
+                print("Failed to switch mode.")
+                return False
 
-        self.cam.BeginAcquisition()
+            self._set_buffer_handling()
+            self._last_frame_id = None  # frame IDs restart with the acquisition
+            self.cam.BeginAcquisition()
         print(f"Switched to {new_mode} mode successfully")
         return True
 
-    def start_recording(self):
-        """Start recording video."""
-        if self.recording:
+    def start_recording(self, on_trigger=False):
+        """
+        Start recording video. With on_trigger the writer is opened now, but recording starts
+        in the grab thread with the next frame (the trigger frame is recorded too).
+        """
+        if self.recording or self.waiting_for_trigger:
             print("Already recording!")
             return False
 
-        try:
-            # Get the first image to determine frame size
-            timeout = 10 if (self.mode == "triggered" and self.waiting_for_trigger) else 1000
-            image_result = self.cam.GetNextImage(timeout)
-
-            if image_result.IsIncomplete():
-                print("Image incomplete")
-                image_result.Release()
-                return False
-
-            # Get image dimensions
-            width = image_result.GetWidth()
-            height = image_result.GetHeight()
+        # Frame size comes from the acquisition thread's frames (or, when armed before any
+        # frame arrived, from the camera's image size)
+        if self._frame_shape is None:
+            self._frame_shape = self._camera_frame_shape()
+        if self._frame_shape is None:
+            print("No frame received yet; cannot start recording.")
+            return False
+        height, width = self._frame_shape[:2]
+        is_color = self.pixel_format == 'BayerRG8' or len(self._frame_shape) == 3
 
-            # Release the image
-            image_result.Release()
+        # Get filename
+        self._current_path = self._get_current_filename()
+        filename = self._current_path_str = os.fspath(self._current_path)
 
-            # Get filename
-            filename = str(self._get_current_filename())
+        # Create video writer (single-channel for Mono8)
+        self.video_writer = None
+        if self.raw_ring_gb > 0:
+            self.video_writer = RawRingWriter(filename, self.fps, self._frame_shape,
+                                              self.pixel_format, self.raw_ring_gb)
+            if not self.video_writer.isOpened():
+                print("Raw capture unavailable, falling back to OpenCV")
+                self.video_writer = None
+        elif self.encoder == "spinvideo":
+            self.video_writer = SpinVideoWriter(filename, self.fps)
+            if not self.video_writer.isOpened():
+                print("SpinVideo writer unavailable, falling back to OpenCV")
+                self.video_writer = None
+        else:
+            # Take a writer pre-opened on a temp file (renamed on stop) if one matches
+            pooled = self._take_pooled_writer((width, height), is_color)
+            if pooled is not None:
+                self.video_writer, self._writer_temp = pooled
+            else:
+                self.video_writer = self._open_writer(filename, (width, height), is_color)
 
-            # Create video writer
+        if self.video_writer is None:
             self.video_writer = cv2.VideoWriter(
                 filename,
                 self.codec,
                 self.fps,
-                (width, height)
+                (width, height),
+                isColor=is_color
             )
 
-            if not self.video_writer.isOpened():
-                print("Failed to open video writer")
-                return False
+        if not self.video_writer.isOpened():
+            print("Failed to open video writer")
+            return False
 
+        self._timestamps = []
+        self._set_buffer_handling(recording=True)
+        if on_trigger:
+            self.waiting_for_trigger = True
+            print(f"Recording armed: {filename}")
+        else:
             self.recording = True
             print(f"Started recording: {filename}")
-            return True
+        self._refill_writer_pool()
+        return True
 
+    def _camera_frame_shape(self):
+        """numpy shape of the frames the camera will send, from its Width/Height nodes."""
+        try:
+            width = PySpin.CIntegerPtr(self.nodemap.GetNode('Width')).GetValue()
+            height = PySpin.CIntegerPtr(self.nodemap.GetNode('Height')).GetValue()
+        except PySpin.SpinnakerException:
+            return None
+        return (height, width, 3) if self.pixel_format == 'BGR8' else (height, width)
+
+    def _open_writer(self, filename, frame_size, is_color):
+        """NVENC pipe if selected and available, else OpenCV; None if neither opens."""
+        if self.encoder == "nvenc":
+            writer = FFmpegVideoWriter(filename, self.fps, frame_size,
+                                       is_color=is_color, bitrate=self.bitrate)
+            if writer.isOpened():
+                return writer
+            print("ffmpeg/NVENC writer unavailable, falling back to OpenCV")
+        writer = cv2.VideoWriter(str(filename), self.codec, self.fps, frame_size, isColor=is_color)
+        return writer if writer.isOpened() else None
+
+    def _take_pooled_writer(self, frame_size, is_color):
+        """Pop a pre-opened (writer, temp_path) for this geometry, or None."""
+        with self._pool_lock:
+            while self._writer_pool:
+                writer, temp_path, key = self._writer_pool.pop()
+                if key == (frame_size, is_color, self.encoder) and writer.isOpened():
+                    return writer, temp_path
+                # stale (geometry/encoder changed): drop it
+                threading.Thread(target=self._discard_writer, args=(writer, temp_path)).start()
+        return None
+
+    def _refill_writer_pool(self):
+        """
+        Open the writer for the next recording in the background, so starting a recording
+        doesn't pay for codec/ffmpeg start-up. Only for the NVENC/OpenCV writers.
+        """
+        if self._frame_shape is None or self.raw_ring_gb > 0 or self.encoder == "spinvideo":
+            return
+        height, width = self._frame_shape[:2]
+        key = ((width, height), self.pixel_format == 'BayerRG8' or len(self._frame_shape) == 3,
+               self.encoder)
+
+        def fill():
+            with self._pool_lock:
+                if self._writer_pool:
+                    return
+                self._pool_serial += 1
+                temp_path = self.output_dir / f".{self.base_filename}pool{self._pool_serial}.avi"
+            writer = self._open_writer(temp_path, *key[:2])
+            if writer is None:
+                return
+            with self._pool_lock:
+                self._writer_pool.append((writer, temp_path, key))
+
+        threading.Thread(target=fill, daemon=True).start()
+
+    @staticmethod
+    def _discard_writer(writer, temp_path):
+        writer.release()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
 
-        except PySpin.SpinnakerException as ex:
-            # very common in triggered mode when no trigger has happened yet
-            if self.mode == "triggered" and self.waiting_for_trigger:
-                # keep UI alive
-                key = cv2.waitKey(1) & 0xFF
-                continue
-            print(f"Error: {ex}")
-            continue
+    @staticmethod
+    def _finish_pooled_recording(writer, temp_path, filename):
+        """Close a pooled writer and move its temp file to the real recording name."""
+        writer.release()
+        os.replace(temp_path, filename)
 
     def stop_recording(self):
         """Stop recording video."""
+        if self.waiting_for_trigger:
+            self._disarm_trigger()
         if not self.recording:
             return
 
+        # Frames grabbed while recording may still be in the ring: let the writer thread
+        # finish them, then detach the writer so it never writes to a released one
         self.recording = False
-
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
-
-        print(f"Stopped recording: {self._get_current_filename()}")
+        head = self._head
+        while (self._tail < head and self._write_thread is not None
+               and self._write_thread.is_alive()):
+            time.sleep(0.001)
+        with self._writer_lock:
+            writer, self.video_writer = self.video_writer, None
+        self._set_buffer_handling()
+
+        if writer and self._writer_temp is not None:
+            # Pooled writer: close and rename off the UI thread
+            threading.Thread(target=self._finish_pooled_recording,
+                             args=(writer, self._writer_temp, self._current_path)).start()
+            self._writer_temp = None
+        elif writer:
+            writer.release()
+
+        print(f"Stopped recording: {self._current_path}")
+
+        # Camera timestamps (ns) of the recorded frames, next to the video
+        timestamps, self._timestamps = self._timestamps, []
+        if timestamps:
+            filename = self._current_path
+            np.save(filename.with_name(f"{filename.stem}_timestamps.npy"),
+                    np.asarray(timestamps, dtype=np.int64))
 
         # Increment recording number for next recording
         self.current_recording_number += 1
+        self._save_recording_number()
+
+    @staticmethod
+    def _image_shape(image_result, size=None):
+        """numpy shape of a Spinnaker image: (h, w) for 1 byte/pixel, else (h, w, c)."""
+        height, width = image_result.GetHeight(), image_result.GetWidth()
+        if size is None:
+            size = image_result.GetBufferSize()
+        channels = size // (height * width)
+        return (height, width) if channels == 1 else (height, width, channels)
+
+    def _copy_to_slot(self, image_result):
+        """
+        Wrap the Spinnaker buffer without copying (GetData + frombuffer) and copy it once into
+        the ring slot at _head, so the buffer can be released straight away. The caller makes
+        sure the ring has a free slot. Returns None if the frame can't be stored.
+        """
+        view = np.frombuffer(image_result.GetData(), dtype=np.uint8)
+        shape = self._image_shape(image_result, view.size)
+
+        if self._ring is None or self._ring[0].shape != shape:
+            # (re)allocate only while the consumer holds no slot
+            if self._ring is not None and self._head != self._tail:
+                return None
+            self._ring = [np.empty(shape, dtype=np.uint8) for _ in range(self.RING_SIZE)]
+
+        slot = self._ring[self._head % self.RING_SIZE]
+        np.copyto(slot, view.reshape(shape))
+        return slot
+
+    def _ring_get(self, timeout):
+        """Consumer side: oldest unconsumed frame, or None after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while self._head == self._tail:
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.001)
+        return self._ring[self._tail % self.RING_SIZE]
+
+    def _draw_overlay(self, frame):
+        """
+        Blit the status overlay onto the frame. Text and the recording dot only change with
+        mode/recording, so they are rasterized once per state and copied in with a mask.
+        While recording the dot blinks at 1 Hz by alternating between two cached strips.
+        """
+        mono = frame.ndim == 2
+        dot = self.recording and int(time.monotonic() * 2) % 2 == 0
+        key = (self.mode, self.recording, dot, mono)
+        cached = self._overlay_cache.get(key)
+        if cached is None:
+            strip = np.zeros((50, 480) if mono else (50, 480, 3), dtype=np.uint8)
+            status_text = f"Mode: {self.mode.upper()}"
+            if self.recording:
+                status_text += " | RECORDING"
+            if dot:
+                cv2.circle(strip, (30, 30), 10, 255 if mono else (0, 0, 255), -1)
+
+            cv2.putText(strip, status_text, (50, 35),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, 255 if mono else (0, 255, 0), 2)
+            mask = strip != 0 if mono else strip.any(axis=2, keepdims=True)
+            cached = self._overlay_cache[key] = (strip, mask)
+
+        strip, mask = cached
+        h = min(strip.shape[0], frame.shape[0])
+        w = min(strip.shape[1], frame.shape[1])
+        np.copyto(frame[:h, :w], strip[:h, :w], where=mask[:h, :w])
+
+    def _read_chunk_data(self, image_result):
+        """
+        Count frames the camera produced but we never received; returns the frame's camera
+        timestamp. In the NewestOnly preview the driver drops frames on purpose, so gaps only
+        count while recording or in OldestFirst mode.
+        """
+        chunk = image_result.GetChunkData()
+        frame_id = chunk.GetFrameID()
+        if (self._last_frame_id is not None and frame_id > self._last_frame_id + 1
+                and (self.recording or self._buffer_mode == 'OldestFirst')):
+            self.lost_frames += frame_id - self._last_frame_id - 1
+        self._last_frame_id = frame_id
+        return chunk.GetTimestamp()
+
+    def _stdin_loop(self):
+        """Headless control: forward the first letter of each stdin line as a key press."""
+        for line in sys.stdin:
+            line = line.strip().lower()
+            if line:
+                self._commands.put(line[0])
+
+    def _grab_loop(self):
+        """
+        Acquisition thread: only grabs frames, copies them out of the Spinnaker buffer and
+        requeues the buffer. Frames go into the ring; when it is full the thread stops grabbing
+        until the consumer catches up, leaving frames in the Spinnaker stream buffers
+        (OldestFirst keeps them, NewestOnly in the preview discards the old ones).
+        """
+        if self.grab_core is not None:
+            pin_current_thread(self.grab_core, high_priority=True)
+
+        while self.running:
+            if self._head - self._tail >= self.RING_SIZE:
+                time.sleep(0.001)
+                continue
+
+            with self._cam_lock:
+                try:
+                    image_result = self.cam.GetNextImage(1000)
+                except PySpin.SpinnakerException:
+                    # timeout (common in triggered mode before the trigger) or stream stopped
+                    image_result = None
+
+                if image_result is not None:
+                    if image_result.IsIncomplete():
+                        # Counted here, reported at most once per second below
+                        self._incomplete_count += 1
+                        frame = None
+                    else:
+                        if self.waiting_for_trigger:
+                            # First frame after arming is the trigger: the writer is already
+                            # open, so this very frame is recorded
+                            self.waiting_for_trigger = False
+                            self.recording = True
+                        ts = self._read_chunk_data(image_result) if self.chunk_data else None
+                        # Whether this frame is recorded is decided here, once; the writer
+                        # thread follows the slot's flag, not the state when it takes the slot
+                        writer = self.video_writer
+                        record = self.recording and writer is not None
+                        # SDK/raw writers record straight from the Spinnaker image
+                        in_grab = record and isinstance(writer, (SpinVideoWriter, RawRingWriter))
+                        if in_grab:
+                            writer.append(image_result)
+                            if ts is not None:
+                                self._timestamps.append(ts)
+
+                        # Pixels only cross to the writer thread if something uses them: a
+                        # frame-consuming recorder, or the (decimated) preview
+                        now = time.monotonic()
+                        show = not self.headless and now - self._last_display_t >= self._display_interval
+                        if show or (record and not in_grab):
+                            frame = self._copy_to_slot(image_result)
+                            if frame is not None and show:
+                                self._last_display_t = now
+                        else:
+                            frame = False  # complete, but not needed downstream
+                        if frame is not None:
+                            self._frame_shape = self._image_shape(image_result)
+                    image_result.Release()
+
+            if image_result is None:
+                if not self.cam.IsStreaming():
+                    time.sleep(0.01)
+                continue
+            if frame is False:
+                continue
+            if frame is None:
+                now = time.monotonic()
+                if now - self._last_log_t > 1.0:
+                    log.warning("Incomplete frames in last second: %d", self._incomplete_count)
+                    self._incomplete_count = 0
+                    self._last_log_t = now
+                continue
+
+            i = self._head % self.RING_SIZE
+            self._ring_show[i] = show
+            self._ring_record[i] = record and not in_grab
+            self._ring_ts[i] = ts
+            self._head += 1  # publish the slot to the consumer
+
+    def _arm_trigger(self):
+        """Open the writer now; recording starts with the first frame from now on (the trigger)."""
+        if self.start_recording(on_trigger=True):
+            print("Triggered mode armed. Waiting for first trigger/frame...")
+
+    def _disarm_trigger(self):
+        """Drop an armed recording whose trigger never came (writer and its empty file)."""
+        # _cam_lock: the grab thread checks waiting_for_trigger while holding it
+        with self._cam_lock:
+            armed, self.waiting_for_trigger = self.waiting_for_trigger, False
+        if not armed:
+            return
+        with self._writer_lock:
+            writer, self.video_writer = self.video_writer, None
+        temp_path, self._writer_temp = self._writer_temp, None
+        if isinstance(writer, RawRingWriter):
+            writer.discard()  # release() would write a sidecar and start a transcode
+        elif writer is not None:
+            self._discard_writer(writer, temp_path or self._current_path)
+        self._set_buffer_handling()
+        print("Trigger disarmed.")
+
+    def _write_loop(self):
+        """
+        Consumer thread: takes every frame from the ring, converts it if needed and writes it
+        to the recorder. preview_fps times a second a copy goes to the single-slot preview queue
+        for the main (UI) thread; if the UI hasn't taken the previous one it is replaced, so
+        a slow window never holds up recording.
+        """
+        # Keep the converting/encoding thread off the grab core
+        if self.encode_core is not None:
+            pin_current_thread(self.encode_core)
+
+        # after quitting, still drain what was grabbed (recorded frames must reach the file)
+        while self.running or self._tail != self._head:
+            image_data = self._ring_get(timeout=0.05)
+            if image_data is None:
+                continue
+
+            # The grab thread marks the preview_fps frames meant for the preview and the frames
+            # grabbed while recording (SpinVideo/raw writers record in the grab thread instead)
+            i = self._tail % self.RING_SIZE
+            show = self._ring_show[i]
+            with self._writer_lock:
+                to_writer = self._ring_record[i] and self.video_writer is not None
+
+                if show or to_writer:
+                    # Mono8/BGR8 frames are used as-is (imshow and the writer take
+                    # single-channel frames); only Bayer data needs converting
+                    if self.pixel_format == 'BayerRG8':
+                        # Debayer into one reused buffer instead of a new array per frame
+                        if self._bgr_buf is None or self._bgr_buf.shape[:2] != image_data.shape[:2]:
+                            self._bgr_buf = np.empty(image_data.shape[:2] + (3,), dtype=np.uint8)
+                        frame = cv2.cvtColor(image_data, cv2.COLOR_BayerRG2BGR, dst=self._bgr_buf)
+                    else:
+                        frame = image_data
+
+                    # Write frame if recording (clean frame, overlay is display-only)
+                    if to_writer:
+                        self.video_writer.write(frame)
+                        ts = self._ring_ts[i]
+                        if ts is not None:
+                            self._timestamps.append(ts)
+
+            if show:
+                # The UI draws on its own copy; the ring slot goes back to the grab thread
+                preview = frame.copy()
+                try:
+                    self._preview_q.get_nowait()
+                except queue.Empty:
+                    pass
+                self._preview_q.put_nowait(preview)
+
+            self._tail += 1  # hand the slot back to the grab thread
 
     def run(self):
         """Main loop for camera operation."""
@@ -415,46 +1263,52 @@ class FLIRCameraController:
             print("  'f' - Switch to free-run mode")
             print("  'q' - Quit")
             print("\nIn triggered mode, recording starts automatically on trigger signal.\n")
+            if self.headless:
+                # No window to take key presses: read the same commands from stdin
+                print("Headless: type a command letter and press Enter.\n")
+                threading.Thread(target=self._stdin_loop, daemon=True).start()
 
-            while self.running:
-                try:
-                    # Get next image
-                    image_result = self.cam.GetNextImage(1000)
+            self._grab_thread = threading.Thread(target=self._grab_loop, daemon=True)
+            self._grab_thread.start()
 
-                    if image_result.IsIncomplete():
-                        print(f"Image incomplete: {image_result.GetImageStatus()}")
-                    else:
-                        # Convert to numpy array
-                        image_data = image_result.GetNDArray()
+            self._write_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._write_thread.start()
 
-                        # Convert to BGR if necessary
-                        if len(image_data.shape) == 2:  # Grayscale
-                            image_bgr = cv2.cvtColor(image_data, cv2.COLOR_GRAY2BGR)
-                        else:
-                            image_bgr = image_data
+            if self.mode == "triggered":
+                self._arm_trigger()
 
+            while self.running:
+                # Pre-open the first recording's writer once the frame size is known
+                if not self._writer_pool_primed and self._frame_shape is not None:
+                    self._refill_writer_pool()
+                    self._writer_pool_primed = True
+
+                # Handle keyboard input (pumps GUI events, so also while waiting)
+                if self.headless:
+                    try:
+                        key = ord(self._commands.get(timeout=0.1))
+                    except queue.Empty:
+                        continue
+                else:
+                    # Latest preview frame from the writer thread (short timeout keeps the UI
+                    # responsive)
+                    try:
+                        frame = self._preview_q.get(timeout=0.05)
+                    except queue.Empty:
+                        frame = None
+
+                    if frame is not None:
                         # Add status overlay
-                        status_text = f"Mode: {self.mode.upper()}"
-                        if self.recording:
-                            status_text += " | RECORDING"
-                            cv2.circle(image_bgr, (30, 30), 10, (0, 0, 255), -1)
-
-                        cv2.putText(image_bgr, status_text, (50, 35),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                        # Write frame if recording
-                        if self.recording and self.video_writer:
-                            self.video_writer.write(image_bgr)
+                        self._draw_overlay(frame)
 
                         # Display frame
-                        cv2.imshow('FLIR Camera', image_bgr)
-
-                    # Release image
-                    image_result.Release()
+                        cv2.imshow('FLIR Camera', frame)
 
-                    # Handle keyboard input
-                    key = cv2.waitKey(1) & 0xFF
+                    key = poll_key() & 0xFF
 
+                # Only the (rare) camera commands can raise; frame handling above stays
+                # outside any try block
+                try:
                     if key == ord('q'):
                         print("Quitting...")
                         self.running = False
@@ -465,22 +1319,21 @@ class FLIRCameraController:
                             self.start_recording()
                     elif key == ord('t'):
                         self.switch_mode("triggered")
-                        self.waiting_for_trigger = True
-                        print("Triggered mode armed. Waiting for first trigger/frame...")
+                        self._arm_trigger()
                     elif key == ord('f'):
-                        self.switch_mode("free-run")
-                        self.waiting_for_trigger = False
-
-
-
+                        self.switch_mode("free-run")  # also drops an unfired arm
                 except PySpin.SpinnakerException as ex:
                     print(f"Error: {ex}")
-                    continue
 
             # Cleanup
-            if self.recording:
+            self._grab_thread.join()
+            self._write_thread.join()
+            if self.recording or self.waiting_for_trigger:
                 self.stop_recording()
 
+            if self.lost_frames:
+                print(f"Camera frame IDs skipped {self.lost_frames} frames")
+
             self.cam.EndAcquisition()
             cv2.destroyAllWindows()
 
@@ -490,9 +1343,21 @@ class FLIRCameraController:
     def cleanup(self):
         """Clean up camera and system resources."""
         try:
-            if self.recording:
+            if self.recording or self.waiting_for_trigger:
                 self.stop_recording()
 
+            self.running = False
+            if self._grab_thread is not None:
+                self._grab_thread.join()
+            if self._write_thread is not None:
+                self._write_thread.join()
+
+            # Unused pre-opened writers: close and remove their temp files
+            with self._pool_lock:
+                pool, self._writer_pool = self._writer_pool, []
+            for writer, temp_path, _ in pool:
+                self._discard_writer(writer, temp_path)
+
             if self.cam:
                 if self.cam.IsStreaming():
                     self.cam.EndAcquisition()
@@ -518,12 +1383,6 @@ def main():
     """Main function."""
     import argparse
 
-    # If we are armed in triggered mode and first frame arrived, start recording NOW
-    if self.mode == "triggered" and self.waiting_for_trigger and not self.recording:
-        self.start_recording()
-        self.waiting_for_trigger = False
-
-
     parser = argparse.ArgumentParser(
         description='FLIR Camera Control with Free-Run and Triggered Modes')
     parser.add_argument('--output-dir', '-o', default='./recordings',
@@ -535,8 +1394,37 @@ def main():
     parser.add_argument('--mode', '-m', choices=['free-run', 'triggered'],
                         default='free-run',
                         help='Initial mode (default: free-run)')
+    parser.add_argument('--encoder', choices=['nvenc', 'spinvideo', 'opencv'], default='nvenc',
+                        help='Video encoder: ffmpeg h264_nvenc pipe, Spinnaker MJPG (SpinVideo) '
+                             'or OpenCV MJPG (default: nvenc)')
+    parser.add_argument('--codec', choices=list(FOURCCS), default='MJPG',
+                        help='FourCC for the OpenCV writer (--encoder opencv and fallback; default: MJPG)')
+    parser.add_argument('--bitrate', default='8M',
+                        help='NVENC constant bitrate, ffmpeg syntax (default: 8M)')
+    parser.add_argument('--raw-ring', type=float, default=0, metavar='GB',
+                        help='Record uncompressed frames into a memory-mapped file of this size '
+                             'and encode with ffmpeg after each recording (default: off)')
+    parser.add_argument('--preview-fps', type=float, default=15,
+                        help='Preview refresh rate; recording always gets every frame (default: 15)')
+    parser.add_argument('--headless', action='store_true',
+                        help='No preview window; control with r/t/f/q + Enter on stdin')
+    parser.add_argument('--install-userset', action='store_true',
+                        help=f'Save the triggered-mode configuration to the camera\'s '
+                             f'{FLIRCameraController.TRIGGER_USERSET} (one-time setup)')
+    parser.add_argument('--use-userset', action='store_true',
+                        help='Switch to triggered mode by loading the saved user set '
+                             '(see --install-userset) instead of writing each trigger node')
+    parser.add_argument('--grab-core', type=int, default=None,
+                        help='Pin the acquisition thread to this CPU core (raised priority)')
+    parser.add_argument('--encode-core', type=int, default=None,
+                        help='Pin the encoding (writer) thread to this CPU core')
 
     args = parser.parse_args()
+    if args.preview_fps <= 0:
+        parser.error('--preview-fps must be > 0 (use --headless for no preview)')
+
+    # Let OpenCV's conversions use the idle cores, leaving two for grabbing and encoding
+    cv2.setNumThreads(max(1, (os.cpu_count() or 1) - 2))
 
     # Create controller
     # Create date folder inside output-dir
@@ -552,12 +1440,26 @@ def main():
     )
     controller.fps = args.fps
     controller.mode = args.mode
+    controller.encoder = args.encoder
+    controller.codec = FOURCCS[args.codec]
+    controller.bitrate = args.bitrate
+    controller.raw_ring_gb = args.raw_ring
+    controller.headless = args.headless
+    controller.preview_fps = args.preview_fps
+    controller.use_userset = args.use_userset
+    controller.grab_core = args.grab_core
+    controller.encode_core = args.encode_core
+
+    log_listener = start_log_listener()
 
     # Initialize camera
     if not controller.initialize_camera():
         print("Failed to initialize camera")
         return 1
 
+    if args.install_userset:
+        controller.install_trigger_userset()
+
     try:
         # Run main loop
         controller.run()
@@ -566,6 +1468,7 @@ def main():
     finally:
         # Cleanup
         controller.cleanup()
+        log_listener.stop()
 
     return 0
 
@@ -573,10 +1476,6 @@ def main():
 if __name__ == "__main__":
     sys.exit(main())
 
-    if self.mode == "triggered" and self.waiting_for_trigger and not self.recording:
-        self.start_recording()
-        self.waiting_for_trigger = False
-
 
 
 
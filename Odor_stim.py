@@ -43,62 +43,29 @@ class Odor_protocol(Protocol):
         self.pause_before_stimulus = Param (0, limits=None)
         self.pause_after_stimulus = Param (0, limits=None)
 
+# One repeat of the protocol: (pin, voltage, duration in s, label)
+    _PATTERN = [
+        (13, 1, 5, "Light ON"),
+        (13, 0, 5, "Light OFF"),
+        (11, 1, 5, "Water ON"),
+        (11, 0, 1, "Water OFF"),
+        (3, 1, 5, "Cadaverine ON"),
+        (3, 0, 1, "Cadaverine OFF"),
+        (11, 1, 5, "Water ON"),
+    ]
+
 # Define the sequence of stimuli in order
     # WriteArduinoPin = Apply voltage to pin(s) on a previously configured arduino
     def get_stim_sequence(self):
         stimuli = [
-            ]
-        for i in range (self.number_of_repeats):
-            #test arduino is working with lightparam stimuli.append(
-            print("Light ON")
-            stimuli.append(
-                WriteArduinoPin(
-                    pin_values_dict={13: 1}, #{pin_number:voltage, ...} can be multiple
-                    duration=5
-                ),)
-            print("Light OFF")
-            stimuli.append(
-                WriteArduinoPin(
-                    pin_values_dict={13: 0},  # {pin_number:voltage, ...} can be multiple
-                    duration=5
-                ), )
-            # water ON
-            print("Water ON")
-            stimuli.append(
-                #The following commands change the voltage on arduino pins
-                WriteArduinoPin(
-                    pin_values_dict={11: 1}, #{pin_number:voltage, ...} can be multiple
-                    duration=5
-                ),)
-            # water OFF
-            print("Water OFF")
-            stimuli.append(
-                WriteArduinoPin(
-                    pin_values_dict={11: 0}, #{pin_number:voltage, ...} can be multiple
-                    duration=1
-                ),)
-            # cadaverine ON
-            print("Cadaverine ON")
-            stimuli.append(
-                WriteArduinoPin(
-                    pin_values_dict={3: 1},  # {pin_number:voltage, ...} can be multiple
-                    duration=5
-                ),)
-            # cadaverine OFF
-            print("Cadaverine OFF")
-            stimuli.append(
-                WriteArduinoPin(
-                    pin_values_dict={3: 0},  # {pin_number:voltage, ...} can be multiple
-                    duration=1
-                ),)
-            # water ON
-            print("Water ON")
-            stimuli.append(
-                # The following commands change the voltage on arduino pins
-                WriteArduinoPin(
-                    pin_values_dict={11: 1},  # {pin_number:voltage, ...} can be multiple
-                    duration=5
-                ),)
+            WriteArduinoPin(
+                pin_values_dict={pin: value}, #{pin_number:voltage, ...} can be multiple
+                duration=duration
+            )
+            for _ in range(self.number_of_repeats)
+            for pin, value, duration, _label in self._PATTERN
+        ]
+        print(f"{self.number_of_repeats} x: " + ", ".join(step[3] for step in self._PATTERN))
         return stimuli
 
 if __name__ == "__main__":
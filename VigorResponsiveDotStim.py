@@ -2,7 +2,7 @@
 
 import numpy as np
 import pandas as pd
-import random, time
+import inspect, time
 
 from stytra import Stytra, Protocol
 from lightparam import Param
@@ -11,18 +11,27 @@ from stytra.stimulation.stimuli.kinematograms import ContinuousRandomDotKinemato
 from PyQt5.QtCore import QRect
 from PyQt5.QtGui import QBrush, QColor
 
-# ------------------ closed-loop subclass ------------------
 
-from PyQt5.QtCore import QRect
-from PyQt5.QtGui import QBrush, QColor
-import time
-from stytra.stimulation.stimuli.kinematograms import ContinuousRandomDotKinematogram
+def _decide(blackout, vig, thr, hyst_low):
+    """Hysteresis step: +1 switch on, -1 switch off, 0 keep."""
+    if not blackout and vig >= thr:
+        return 1
+    if blackout and vig <= hyst_low:
+        return -1
+    return 0
+
+# ------------------ closed-loop subclass ------------------
 
 class VigorResponsiveDotStim(ContinuousRandomDotKinematogram):
     """
     Moving dots with vigor-triggered blackout (and BLACKOUT_ON/OFF event logs).
-    NOTE: Do not store Qt objects on self; Stytra deep-copies stimuli.
+    NOTE: Stytra deep-copies stimuli; Qt objects on self are created lazily
+    in paint() and left out of __getstate__.
     """
+    # base update() signature is fixed; check once instead of catching TypeError
+    _update_takes_args = len(
+        inspect.signature(ContinuousRandomDotKinematogram.update).parameters) > 1
+
     def __init__(self, *args,
                  vigor_threshold=30.0,
                  hysteresis=5.0,
@@ -32,62 +41,80 @@ class VigorResponsiveDotStim(ContinuousRandomDotKinematogram):
         self.vigor_threshold = float(vigor_threshold)
         self.hysteresis = float(hysteresis)
         self.blackout_min_ms = int(blackout_min_ms)
+        self.blackout_min_ns = self.blackout_min_ms * 1_000_000
+        self._hyst_low = self.vigor_threshold - self.hysteresis
         self._blackout = False
-        self._last_switch_ms = 0  # ms since epoch
+        self._last_switch_ns = 0  # time.monotonic_ns() of the last switch
+        self._estimator = None  # resolved lazily by _get_vigor
+        self._black_brush = None  # Qt paint cache, built on first paint
+        self._rect_cache = (0, 0, None)
 
     # ---------- helpers ----------
     def _get_vigor(self):
-        exp = getattr(self, "_experiment", None)
-        if exp is None or not hasattr(exp, "estimator"):
-            return None
-        # prefer estimator.vigor if present
-        vig = getattr(exp.estimator, "vigor", None)
-        if vig is not None:
-            try:
-                return float(vig)
-            except Exception:
-                return None
-        # fallback to |velocity|
-        if hasattr(exp.estimator, "get_velocity"):
-            try:
-                return abs(float(exp.estimator.get_velocity()))
-            except Exception:
+        # the experiment/estimator lookup is done once and the estimator kept
+        est = self._estimator
+        if est is None:
+            exp = getattr(self, "_experiment", None)
+            est = self._estimator = getattr(exp, "estimator", None)
+            if est is None:
                 return None
+        try:
+            # prefer estimator.vigor if present (checked every frame: it may
+            # still be None while the estimator warms up)
+            vig = getattr(est, "vigor", None)
+            if vig is not None:
+                return float(vig)
+            # fallback to |velocity|
+            if hasattr(est, "get_velocity"):
+                return abs(float(est.get_velocity()))
+        except Exception:
+            return None
         return None
 
     def _switch_blackout(self, new_state: bool):
         self._blackout = new_state
-        self._last_switch_ms = int(time.time() * 1000)
-        # Log event to Stytra’s run log (seconds resolution)
+        self._last_switch_ns = time.monotonic_ns()
+        # Log event to Stytra’s run log (seconds)
         if hasattr(self, "log_event"):
             label = "BLACKOUT_ON" if new_state else "BLACKOUT_OFF"
-            self.log_event(label, value=self._last_switch_ms / 1000.0)
+            self.log_event(label, value=self._last_switch_ns * 1e-9)
 
     def _maybe_toggle_blackout(self):
-        now = int(time.time() * 1000)
-        if (now - self._last_switch_ms) < self.blackout_min_ms:
+        # monotonic int ns: no float math, immune to wall-clock jumps
+        now = time.monotonic_ns()
+        if (now - self._last_switch_ns) < self.blackout_min_ns:
             return
         vig = self._get_vigor()
         if vig is None:
             return
-        if not self._blackout and vig >= self.vigor_threshold:
-            self._switch_blackout(True)
-        elif self._blackout and vig <= (self.vigor_threshold - self.hysteresis):
-            self._switch_blackout(False)
+        step = _decide(self._blackout, vig, self.vigor_threshold, self._hyst_low)
+        if step:
+            self._switch_blackout(step > 0)
 
     # ---------- stimulus API ----------
     def update(self, *args, **kwargs):
         self._maybe_toggle_blackout()
-        try:
+        if self._blackout:
+            # paint() draws a black rect over everything, so skip the dot
+            # motion; only keep the base-class frame clock in step so the
+            # first frame after the blackout doesn't move dots by its length
+            self._dt = self._elapsed - self._past_t
+            self._past_t = self._elapsed
+            return
+        if self._update_takes_args:
             return super().update(*args, **kwargs)
-        except TypeError:
-            return super().update()
+        return super().update()
 
     def paint(self, p, w, h):
         if self._blackout:
-            # Create Qt objects as locals (pickle-safe)
-            p.setBrush(QBrush(QColor(0, 0, 0)))
-            p.drawRect(QRect(0, 0, w, h))
+            if self._black_brush is None:
+                self._black_brush = QBrush(QColor(0, 0, 0))
+            cw, ch, rect = self._rect_cache
+            if rect is None or cw != w or ch != h:
+                rect = QRect(0, 0, w, h)
+                self._rect_cache = (w, h, rect)
+            p.setBrush(self._black_brush)
+            p.drawRect(rect)
         else:
             super().paint(p, w, h)
 
@@ -99,7 +126,7 @@ class VigorResponsiveDotStim(ContinuousRandomDotKinematogram):
             "hysteresis": self.hysteresis,
             "blackout_min_ms": self.blackout_min_ms,
             "_blackout": self._blackout,
-            "_last_switch_ms": self._last_switch_ms,
+            "_last_switch_ns": self._last_switch_ns,
         }
 
     def __setstate__(self, state):
@@ -107,7 +134,12 @@ class VigorResponsiveDotStim(ContinuousRandomDotKinematogram):
         self.hysteresis = state["hysteresis"]
         self.blackout_min_ms = state["blackout_min_ms"]
         self._blackout = state["_blackout"]
-        self._last_switch_ms = state["_last_switch_ms"]
+        self._last_switch_ns = state["_last_switch_ns"]
+        self.blackout_min_ns = self.blackout_min_ms * 1_000_000
+        self._hyst_low = self.vigor_threshold - self.hysteresis
+        self._estimator = None  # re-resolve against the new experiment
+        self._black_brush = None
+        self._rect_cache = (0, 0, None)
 
 
 # ------------------ protocol ------------------
@@ -161,11 +193,14 @@ class VisualStim_dots(Protocol):
         )
 
     def get_stim_sequence(self):
+        n = int(self.number_of_repeats)
+        # draw all directions at once (pre, closed-loop, post per repeat)
+        thetas = np.random.default_rng().choice(self.left_right, size=3 * n)
         stimuli = []
-        for _ in range(int(self.number_of_repeats)):
-            stimuli.append(self._crdk(self.t_pre, 0, random.choice(self.left_right)))
-            stimuli.append(self._crdk_closedloop(self.t_closed, 1, random.choice(self.left_right)))
-            stimuli.append(self._crdk(self.t_post, 0, random.choice(self.left_right)))
+        for k in range(n):
+            stimuli.append(self._crdk(self.t_pre, 0, int(thetas[3 * k])))
+            stimuli.append(self._crdk_closedloop(self.t_closed, 1, int(thetas[3 * k + 1])))
+            stimuli.append(self._crdk(self.t_post, 0, int(thetas[3 * k + 2])))
         return stimuli
 
 # ------------------ launcher ------------------
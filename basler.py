@@ -1,6 +1,11 @@
 # C:\Users\sleeproom\miniconda3\envs\stytra_env\Lib\site-packages\stytra\hardware\video\cameras
 # edited to run with stytra
 
+import os
+import sys
+
+import numpy as np
+
 from stytra.hardware.video.cameras.interface import Camera
 
 try:
@@ -16,10 +21,15 @@ except ImportError as e:
     ) from e
 
 
-def _enum_set(nodemap, name, value):
+def _enum_set(nodemap, name, value, params=None):
+    # `params`: parameter wrappers pre-resolved by name (see open_camera)
+
     try:
 
-        par = pylon.EnumerationParameter(nodemap, name)
+        par = params.get(name) if params else None
+
+        if par is None:
+            par = pylon.EnumerationParameter(nodemap, name)
 
         if par.IsWritable():
 
@@ -39,14 +49,17 @@ def _enum_set(nodemap, name, value):
     return False
 
 
-def _float_set(nodemap, names, value):
+def _float_set(nodemap, names, value, params=None):
     # try several canonical names (e.g. ExposureTime vs ExposureTimeAbs)
 
     for nm in names:
 
         try:
 
-            par = pylon.FloatParameter(nodemap, nm)
+            par = params.get(nm) if params else None
+
+            if par is None:
+                par = pylon.FloatParameter(nodemap, nm)
 
             if par.IsWritable():
                 lo, hi = par.GetMin(), par.GetMax()
@@ -62,17 +75,61 @@ def _float_set(nodemap, names, value):
     return False
 
 
+def _make_realtime(core):
+    # pin the calling (acquisition) thread to one core and give it real-time
+    # priority so RetrieveResult doesn't compete with the GUI for the CPU
+
+    if sys.platform == "win32":
+
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+
+        thread = kernel32.GetCurrentThread()
+
+        if core is not None:
+            kernel32.SetThreadAffinityMask(thread, 1 << core)
+
+        if not kernel32.SetThreadPriority(thread, 15):  # THREAD_PRIORITY_TIME_CRITICAL
+            raise OSError("SetThreadPriority failed")
+
+    else:
+
+        if core is not None:
+            os.sched_setaffinity(0, {core})
+
+        # SCHED_FIFO needs root / CAP_SYS_NICE
+
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+
+
 class BaslerCamera(Camera):
     """Stytra camera backend for Basler GigE/USB via pypylon."""
 
-    def __init__(self, device_idx=0, **kwargs):
+    def __init__(self, device_idx=0, cam_idx=None, realtime=False, core=None, **kwargs):
 
         super().__init__(**kwargs)
 
-        self.device_idx = int(device_idx)
+        # the protocols configure camera=dict(type="basler", cam_idx=...)
+
+        self.device_idx = int(device_idx if cam_idx is None else cam_idx)
+
+        # opt-in: pin the acquisition thread to `core` at real-time priority
+
+        self.realtime = bool(realtime)
+
+        self.core = core
 
         self.cam = None
 
+        self._nm = None
+
+        self._params = {}
+
+        # frame handed to stytra; reused, valid until the next read()
+
+        self._out = None
+
     def open_camera(self):
 
         tl = pylon.TlFactory.GetInstance()
@@ -89,24 +146,123 @@ class BaslerCamera(Camera):
 
         self.cam.Open()
 
-        # Prefer grayscale 8-bit frames if available
+        # Stytra gets 2D grayscale 8-bit frames
+
+        nm = self._nm = self.cam.GetNodeMap()  # cached for set()
+
+        # resolve the nodes set() touches once instead of on every call
+
+        self._params = {}
+
+        for name in ("ExposureTime", "ExposureTimeAbs", "Gain", "GainRaw",
+                     "AcquisitionFrameRate", "AcquisitionFrameRateAbs"):
+
+            try:
+                self._params[name] = pylon.FloatParameter(nm, name)
+
+            except Exception:
+                pass
+
+        for name in ("ExposureAuto", "GainAuto", "PixelFormat"):
+
+            try:
+                self._params[name] = pylon.EnumerationParameter(nm, name)
+
+            except Exception:
+                pass
+
+        _enum_set(nm, "PixelFormat", "Mono8", self._params)
+
+        # refuse a readable non-Mono8 format here rather than slicing a channel
+        # off every frame in read(); models without a readable PixelFormat are
+        # still accepted (read() drops a channel if one shows up)
+
+        pf = self._params.get("PixelFormat")
+
+        try:
+
+            current = pf.GetValue() if pf is not None and pf.IsReadable() else None
 
-        nm = self.cam.GetNodeMap()
+        except Exception:
+
+            current = None
+
+        if current is not None and current != "Mono8":
+            self.release()
+
+            return [f"E:Basler camera streams {current}; PixelFormat Mono8 is required"]
+
+        # More host buffers and the largest socket buffer absorb OS
+        # scheduling jitter (avoids "buffer incompletely grabbed"); the GigE
+        # nodes are missing on USB3 models, hence the try blocks
+
+        try:
+
+            self.cam.MaxNumBuffer.Value = 24
+
+            sbs = pylon.IntegerParameter(self.cam.GetStreamGrabberNodeMap(), "SocketBufferSize")
+
+            sbs.SetValue(sbs.GetMax())
+
+        except Exception:
+
+            pass
+
+        if "GigE" in self.cam.GetDeviceInfo().GetDeviceClass():
+
+            # jumbo packets plus an inter-packet delay keep the NIC from
+            # dropping packets in long sessions (what pylonGigEConfigurator sets)
+
+            try:
+
+                pks = pylon.IntegerParameter(nm, "GevSCPSPacketSize")
+
+                try:
+                    pks.SetValue(9000)
+
+                except Exception:
+                    pks.SetValue(pks.GetMax())
+
+            except Exception:
+
+                pass
+
+            try:
+
+                pylon.IntegerParameter(nm, "GevSCPD").SetValue(2000)
 
-        _enum_set(nm, "PixelFormat", "Mono8")  # ok if not present
+            except Exception:
+
+                pass
 
         # Start grabbing with low-latency strategy for live GUIs
 
         self.cam.StartGrabbing(pylon.GrabStrategy_LatestImageOnly)
 
-        return ["I:Basler camera opened"]
+        messages = ["I:Basler camera opened"]
+
+        if self.realtime:
+
+            # read() runs on this same thread
+
+            try:
+
+                _make_realtime(self.core)
+
+                messages.append("I:acquisition thread set to real-time priority")
+
+            except (AttributeError, OSError) as e:
+
+                messages.append(f"W: could not raise acquisition priority: {e}")
+
+        return messages
 
     def set(self, param, val):
 
         if self.cam is None:
             return "W: camera not open"
 
-        nm = self.cam.GetNodeMap()
+        nm = self._nm
 
         try:
 
@@ -116,9 +272,9 @@ class BaslerCamera(Camera):
 
                 us = float(val) * 1000.0
 
-                _enum_set(nm, "ExposureAuto", "Off")
+                _enum_set(nm, "ExposureAuto", "Off", self._params)
 
-                ok = _float_set(nm, ["ExposureTime", "ExposureTimeAbs"], us)
+                ok = _float_set(nm, ["ExposureTime", "ExposureTimeAbs"], us, self._params)
 
                 return "" if ok else "W: exposure control not supported on this model"
 
@@ -136,7 +292,8 @@ class BaslerCamera(Camera):
 
                     pass
 
-                ok = _float_set(nm, ["AcquisitionFrameRate", "AcquisitionFrameRateAbs"], float(val))
+                ok = _float_set(nm, ["AcquisitionFrameRate", "AcquisitionFrameRateAbs"], float(val),
+                                self._params)
 
                 return "" if ok else "W: framerate control not supported"
 
@@ -144,9 +301,9 @@ class BaslerCamera(Camera):
 
             elif param == "gain":
 
-                _enum_set(nm, "GainAuto", "Off")
+                _enum_set(nm, "GainAuto", "Off", self._params)
 
-                ok = _float_set(nm, ["Gain", "GainRaw"], float(val))
+                ok = _float_set(nm, ["Gain", "GainRaw"], float(val), self._params)
 
                 return "" if ok else "W: gain control not supported"
 
@@ -220,14 +377,23 @@ class BaslerCamera(Camera):
 
             if grab.GrabSucceeded():
 
-                arr = grab.Array
+                # copy straight out of the pylon buffer into a reused array
+                # (grab.Array allocates and copies a new frame every call)
 
-                # ensure 2D grayscale for Stytra (drop channel if Bayer/RGB sneaks in)
+                with grab.GetArrayZeroCopy() as v:
 
-                if arr.ndim == 3:
-                    arr = arr[:, :, 0]
+                    # 2D for Mono8; only a model without a readable PixelFormat
+                    # can get here with a channel axis
 
-                return arr
+                    if v.ndim == 3:
+                        v = v[:, :, 0]
+
+                    if self._out is None or self._out.shape != v.shape:
+                        self._out = np.empty(v.shape, dtype=v.dtype)
+
+                    np.copyto(self._out, v)
+
+                return self._out
 
             return None
 
@@ -259,3 +425,7 @@ class BaslerCamera(Camera):
 
             self.cam = None
 
+            self._nm = None
+
+            self._params = {}
+
@@ -9,8 +9,9 @@ HOW IT WORKS
         ">>> WAITING FOR RISING EDGE …"
     and does NOT advance to the first stimulus.
 
-2.  A background thread continuously polls the configured analog‑input
-    channel (AI0) on your NI DAQ board and compares it to a 2.5V threshold.
+2.  The NI DAQ board samples the configured analog‑input channel (AI0) on
+    its hardware clock; a DAQmx callback compares each block of samples to
+    a 2.5V threshold (no polling thread).
 
 3.  RISING EDGE (voltage crosses above 2.5V)  →  the stimulus sequence
     starts from the beginning (pre‑stim → coherent motion → post‑stim,
@@ -50,7 +51,6 @@ the VisualStim_dots.__init__ method as before.
 import numpy as np
 import pandas as pd
 import random
-import time
 import threading
 import traceback
 
@@ -64,6 +64,7 @@ from typing import Optional
 import json
 
 import nidaqmx
+from nidaqmx.stream_readers import AnalogSingleChannelReader
 
 # ──────────────────────────────────────────────
 # USER‑CONFIGURABLE  –  edit these lines
@@ -74,9 +75,12 @@ DAQ_THRESHOLD_V  = 2.5             # Voltage threshold for edge detection (V)
 # Rising edge  = voltage crosses above 2.5V
 # Falling edge = voltage drops below 2.5V
 
-# How often (seconds) the background thread checks the DAQ line.
-# 0.005 s  →  ~200 Hz polling  (plenty fast for behavioural paradigms)
-_POLL_INTERVAL = 0.005
+# AI0 is sampled on the DAQ's own clock; the driver hands us a block of
+# _SAMPLES_PER_EVENT samples at a time, so an edge is seen within
+# _SAMPLES_PER_EVENT / _SAMPLE_RATE s  (10 / 2000 Hz → 5 ms) and no edge
+# between blocks can be missed.
+_SAMPLE_RATE       = 2000.0        # Hz
+_SAMPLES_PER_EVENT = 10
 
 
 # ──────────────────────────────────────────────────────────
@@ -139,13 +143,17 @@ class TrackedDotStim(ContinuousRandomDotKinematogram):
 
 
 # ──────────────────────────────────────────────────────────
-# DAQ helper  –  runs in its own thread
+# DAQ helper  –  driven by DAQmx callbacks
 # ──────────────────────────────────────────────────────────
 
 class DAQEdgeMonitor:
     """
-    Polls an analog input channel (AI0) and detects rising/falling edges
-    by checking if the voltage crosses above/below a threshold (2.5 V).
+    Samples an analog input channel (AI0) on the DAQ's hardware clock and
+    detects rising/falling edges by checking if the voltage crosses
+    above/below a threshold (2.5 V).
+
+    No polling thread: the DAQmx driver calls _on_samples every
+    `samples_per_event` samples, so the process only wakes when data is there.
 
     Attributes / events that the protocol uses
     -------------------------------------------
@@ -154,39 +162,64 @@ class DAQEdgeMonitor:
     """
 
     def __init__(self, device: str, ai_channel: str = "ai0",
-                 threshold: float = 2.5, poll_interval: float = _POLL_INTERVAL):
-        self.device        = device
-        self.ai_channel    = ai_channel
-        self.channel_name  = f"{device}/{ai_channel}"
-        self.threshold     = threshold
-        self.poll_interval = poll_interval
+                 threshold: float = 2.5, sample_rate: float = _SAMPLE_RATE,
+                 samples_per_event: int = _SAMPLES_PER_EVENT):
+        self.device            = device
+        self.ai_channel        = ai_channel
+        self.channel_name      = f"{device}/{ai_channel}"
+        self.threshold         = threshold
+        self.sample_rate       = sample_rate
+        self.samples_per_event = samples_per_event
 
         # Synchronisation primitives
         self.rising_edge_event  = threading.Event()
         self.falling_edge_event = threading.Event()
 
         # Internal state
-        self._prev_above   = None        # was voltage above threshold last poll?
-        self._stop_flag    = threading.Event()
-        self._thread       = None
+        self._prev_above   = None        # was voltage above threshold last sample?
+        self._task         = None
+        self._reader       = None
+        self._buf          = np.empty(samples_per_event, dtype=np.float64)
 
     # ── public API ────────────────────────────────────────
 
     def start(self):
-        """Start the background polling thread."""
-        self._stop_flag.clear()
+        """Start hardware‑timed acquisition with the edge callback."""
+        self._close_task()               # re‑triggered Play: don't leak a task
         self.rising_edge_event.clear()
         self.falling_edge_event.clear()
         self._prev_above = None
-        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
-        self._thread.start()
+        try:
+            task = nidaqmx.Task()
+            self._task = task
+            task.ai_channels.add_ai_voltage_chan(
+                self.channel_name,
+                terminal_config=nidaqmx.constants.TerminalConfiguration.RSE,
+                min_val=-10.0,
+                max_val=10.0
+            )
+            task.timing.cfg_samp_clk_timing(
+                self.sample_rate,
+                sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
+                samps_per_chan=int(self.sample_rate)   # 1 s host buffer
+            )
+            # stream reader fills self._buf in place: one driver call per
+            # block, no per‑read list building or channel lookups
+            self._reader = AnalogSingleChannelReader(task.in_stream)
+            task.register_every_n_samples_acquired_into_buffer_event(
+                self.samples_per_event, self._on_samples
+            )
+            task.start()
+        except Exception as e:
+            print(f"[DAQ] Fatal error starting monitor: {e}")
+            traceback.print_exc()
+            self._close_task()
+            return
         print(f"[DAQ] Monitoring {self.channel_name} (threshold {self.threshold}V) …")
 
     def stop(self):
-        """Stop the background polling thread."""
-        self._stop_flag.set()
-        if self._thread is not None:
-            self._thread.join(timeout=2.0)
+        """Stop acquisition and release the DAQmx task."""
+        self._close_task()
         print("[DAQ] Monitor stopped.")
 
     def clear_rising(self):
@@ -197,51 +230,54 @@ class DAQEdgeMonitor:
 
     # ── internal ──────────────────────────────────────────
 
-    def _poll_loop(self):
+    def _close_task(self):
+        task, self._task = self._task, None
+        self._reader = None
+        if task is not None:
+            try:
+                task.close()
+            except Exception as e:
+                print(f"[DAQ] Error closing task: {e}")
+
+    def _on_samples(self, task_handle, every_n_samples_event_type,
+                    number_of_samples, callback_data):
         """
-        Opens a DAQmx task for analog input on AI0.
-        Reads voltage continuously; detects when it crosses above/below threshold.
+        DAQmx every‑N‑samples callback (driver thread).
+        Reads the new block and detects when it crosses above/below threshold.
         """
+        reader = self._reader
+        if reader is None:
+            return 0
+        if self._buf.size != number_of_samples:
+            self._buf = np.empty(number_of_samples, dtype=np.float64)
+        voltages = self._buf
         try:
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_voltage_chan(
-                    self.channel_name,
-                    terminal_config=nidaqmx.constants.TerminalConfiguration.RSE,
-                    min_val=-10.0,
-                    max_val=10.0
-                )
-
-                while not self._stop_flag.is_set():
-                    try:
-                        voltage = task.read(timeout=self.poll_interval)
-                        above = (voltage > self.threshold)
-
-                        # Edge detection
-                        if self._prev_above is not None and above != self._prev_above:
-                            if above:
-                                # LOW → HIGH (voltage crossed above threshold)
-                                print(f"[DAQ] RISING:  voltage crossed above {self.threshold}V → {voltage:.3f}V")
-                                self.falling_edge_event.clear()
-                                self.rising_edge_event.set()
-                            else:
-                                # HIGH → LOW (voltage dropped below threshold)
-                                print(f"[DAQ] FALLING: voltage dropped below {self.threshold}V → {voltage:.3f}V")
-                                self.rising_edge_event.clear()
-                                self.falling_edge_event.set()
-
-                        self._prev_above = above
-
-                    except nidaqmx.errors.WaitingForDataError:
-                        # No new sample within timeout – that's fine, just loop
-                        continue
-                    except Exception as e:
-                        print(f"[DAQ] Read error: {e}")
-                        time.sleep(self.poll_interval)
-                        continue
-
+            reader.read_many_sample(voltages, number_of_samples_per_channel=number_of_samples)
         except Exception as e:
-            print(f"[DAQ] Fatal error in poll loop: {e}")
-            traceback.print_exc()
+            print(f"[DAQ] Read error: {e}")
+            return 0
+
+        # Edge detection over the whole block: +1 = rising, -1 = falling
+        above = (voltages > self.threshold)
+        prev = above[0] if self._prev_above is None else self._prev_above
+        edges = np.diff(above.astype(np.int8), prepend=np.int8(prev))
+        self._prev_above = bool(above[-1])
+
+        # edges are rare; handle each in order so a short pulse inside one
+        # block still sets (then clears) rising_edge_event as before
+        for i in np.flatnonzero(edges):
+            voltage = voltages[i]
+            if edges[i] > 0:
+                # LOW → HIGH (voltage crossed above threshold)
+                print(f"[DAQ] RISING:  voltage crossed above {self.threshold}V → {voltage:.3f}V")
+                self.falling_edge_event.clear()
+                self.rising_edge_event.set()
+            else:
+                # HIGH → LOW (voltage dropped below threshold)
+                print(f"[DAQ] FALLING: voltage dropped below {self.threshold}V → {voltage:.3f}V")
+                self.rising_edge_event.clear()
+                self.falling_edge_event.set()
+        return 0
 
 
 